@@ -0,0 +1,208 @@
+"""API HTTP de l'estimateur.
+
+Expose le pipeline d'estimation (classification, calcul, analyse détaillée) en JSON.
+Chaque processus de travail charge son propre catalogue ; le cache SQLite des
+réponses est partagé par tous les processus d'une même machine.
+
+    uvicorn api:app --workers 4
+    API_WORKERS=4 python api.py
+"""
+import asyncio
+import json
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Literal, Optional
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+
+import estimator
+from metrics import metrics
+
+# Estimations traitées simultanément par processus : borne la mémoire et le nombre
+# de threads occupés ; les requêtes suivantes attendent leur tour.
+API_MAX_CONCURRENCY = int(os.getenv("API_MAX_CONCURRENCY", "32"))
+MAX_QUESTION_LENGTH = int(os.getenv("MAX_QUESTION_LENGTH", "4000"))
+
+ClientType = Literal["Particulier", "Professionnel", "Société"]
+Urgency = Literal["Normal", "Urgent"]
+
+_slots: Optional[asyncio.Semaphore] = None
+
+
+class EstimateRequest(BaseModel):
+    question: str = Field(min_length=1, max_length=MAX_QUESTION_LENGTH)
+    client_type: ClientType = "Particulier"
+    urgency: Urgency = "Normal"
+    # Cabinet dont le catalogue compilé fixe les tarifs (CATALOGUE_STORE) ; cabinet par défaut sinon
+    office: Optional[str] = None
+
+
+class AnalysisRequest(EstimateRequest):
+    domaine: str
+    prestation: str
+
+
+class QuoteRequest(BaseModel):
+    domaine: str
+    prestation: str
+    urgency: Urgency = "Normal"
+    office: Optional[str] = None
+
+
+class ClassificationResponse(BaseModel):
+    domaine: str
+    prestation: str
+
+
+class QuoteResponse(BaseModel):
+    estimation_basse: int
+    estimation_haute: int
+    calcul_details: List[str]
+    tarifs_utilises: Dict[str, Any]
+
+
+class AnalysisResponse(BaseModel):
+    detailed_analysis: str
+    elements_used: Dict[str, Any]
+    sources: str
+
+
+class EstimateResponse(ClassificationResponse, QuoteResponse, AnalysisResponse):
+    pass
+
+
+class CatalogueResponse(BaseModel):
+    version: str
+    prestations: Dict[str, Dict[str, float]]
+    tarifs: Dict[str, Any]
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global _slots
+    _slots = asyncio.Semaphore(API_MAX_CONCURRENCY)
+    metrics.register_collector("api", lambda: {"available_slots": _slots._value})
+    yield
+
+
+app = FastAPI(title="View Avocats - Estimateur de devis", lifespan=lifespan)
+
+
+@app.middleware("http")
+async def mesurer(request: Request, call_next):
+    debut = time.perf_counter()
+    reponse = await call_next(request)
+    # Gabarit de la route plutôt que le chemin reçu : nombre d'étiquettes borné
+    route = request.scope.get("route")
+    chemin = route.path if route is not None else "unmatched"
+    metrics.observe("http_request", time.perf_counter() - debut, path=chemin)
+    metrics.increment("http_requests", path=chemin, status=reponse.status_code)
+    return reponse
+
+
+async def _run(fonction, *args):
+    """Exécute une étape synchrone du pipeline hors de la boucle d'événements."""
+    async with _slots:
+        return await run_in_threadpool(fonction, *args)
+
+
+def _catalogue(office: Optional[str]):
+    try:
+        return estimator.get_catalogue(office)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+def _quote(domaine: str, prestation: str, urgency: str, office: Optional[str] = None) -> QuoteResponse:
+    _catalogue(office)
+    estimation_basse, estimation_haute, calcul_details, tarifs_utilises = estimator.calculate_estimate(domaine, prestation, urgency, office)
+    return QuoteResponse(estimation_basse=estimation_basse, estimation_haute=estimation_haute,
+                         calcul_details=calcul_details, tarifs_utilises=tarifs_utilises)
+
+
+@app.post("/estimate", response_model=EstimateResponse)
+async def estimate(requete: EstimateRequest) -> EstimateResponse:
+    _catalogue(requete.office)
+    domaine, prestation, detailed_analysis, elements_used, sources = await _run(
+        estimator.estimate_question, requete.question, requete.client_type, requete.urgency
+    )
+    quote = _quote(domaine, prestation, requete.urgency, requete.office)
+    return EstimateResponse(domaine=domaine, prestation=prestation, detailed_analysis=detailed_analysis,
+                            elements_used=elements_used, sources=sources, **quote.model_dump())
+
+
+@app.post("/classify", response_model=ClassificationResponse)
+async def classify(requete: EstimateRequest) -> ClassificationResponse:
+    domaine, prestation = await _run(estimator.analyze_question, requete.question, requete.client_type, requete.urgency)
+    return ClassificationResponse(domaine=domaine, prestation=prestation)
+
+
+@app.post("/quote", response_model=QuoteResponse)
+async def quote(requete: QuoteRequest) -> QuoteResponse:
+    # Lecture dans la table précalculée : pas besoin de quitter la boucle d'événements
+    return _quote(requete.domaine, requete.prestation, requete.urgency, requete.office)
+
+
+@app.post("/analysis", response_model=AnalysisResponse)
+async def analysis(requete: AnalysisRequest) -> AnalysisResponse:
+    detailed_analysis, elements_used, sources = await _run(
+        estimator.get_detailed_analysis, requete.question, requete.client_type, requete.urgency, requete.domaine, requete.prestation
+    )
+    return AnalysisResponse(detailed_analysis=detailed_analysis, elements_used=elements_used, sources=sources)
+
+
+@app.post("/analysis/stream")
+async def analysis_stream(requete: AnalysisRequest) -> StreamingResponse:
+    """Analyse détaillée en NDJSON : des lignes {"text": ...} au fil de l'eau, puis une
+    dernière ligne avec analysis, elements_used et sources."""
+    flux = estimator.DetailedAnalysisStream(requete.question, requete.client_type, requete.urgency, requete.domaine, requete.prestation)
+
+    async def lignes():
+        async with _slots:
+            async for texte in iterate_in_threadpool(iter(flux)):
+                yield json.dumps({"text": texte}, ensure_ascii=False) + "\n"
+        yield json.dumps({"analysis": flux.analysis, "elements_used": flux.elements_used, "sources": flux.sources}, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(lignes(), media_type="application/x-ndjson")
+
+
+@app.get("/catalogue", response_model=CatalogueResponse)
+async def catalogue(office: Optional[str] = None) -> CatalogueResponse:
+    courant = _catalogue(office)
+    return CatalogueResponse(version=courant.content_hash, prestations=courant.prestations, tarifs=courant.tarifs)
+
+
+@app.get("/healthz")
+async def healthz() -> Dict[str, Any]:
+    return {
+        "status": "ok",
+        "catalogue": estimator.get_catalogue().content_hash,
+        "circuit_breaker": estimator.resilient.breaker.state,
+        "mode": estimator.ESTIMATION_MODE,
+        "scheduler_depth": estimator.scheduler.depth() if estimator.scheduler is not None else None,
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus() -> str:
+    # Mesures du seul processus ayant reçu la requête
+    return metrics.render_prometheus()
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(
+        "api:app",
+        host=os.getenv("API_HOST", "0.0.0.0"),
+        port=int(os.getenv("API_PORT", "8000")),
+        workers=int(os.getenv("API_WORKERS", "4")),
+        # Recyclage périodique des processus et refus (503) au-delà de la limite de connexions
+        limit_max_requests=int(os.getenv("API_MAX_REQUESTS", "0")) or None,
+        limit_concurrency=int(os.getenv("API_LIMIT_CONCURRENCY", "0")) or None,
+        log_config=None,
+    )
@@ -0,0 +1,100 @@
+"""Client de l'API d'estimation (api.py), avec la même interface que le module estimator.
+
+Utilisé par l'application Streamlit lorsque ESTIMATOR_API_URL est défini : l'interface
+n'a alors besoin ni de la clé OpenAI ni des fichiers du catalogue.
+"""
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Iterator, Tuple
+
+import httpx
+
+ESTIMATOR_API_URL = os.getenv("ESTIMATOR_API_URL", "http://localhost:8000")
+ESTIMATION_MODE = os.getenv("ESTIMATION_MODE", "structured")
+CATALOGUE_CHECK_INTERVAL = float(os.getenv("CATALOGUE_CHECK_INTERVAL", "30"))
+
+# Client partagé par toutes les sessions Streamlit du processus
+http = httpx.Client(
+    base_url=ESTIMATOR_API_URL,
+    timeout=httpx.Timeout(float(os.getenv("ESTIMATE_DEADLINE", "30")) + 5, connect=5.0),
+    limits=httpx.Limits(max_connections=50, max_keepalive_connections=20),
+)
+
+
+class RemoteCatalogue:
+    def __init__(self, donnees: Dict[str, Any]):
+        self.content_hash = donnees["version"]
+        self.prestations = donnees["prestations"]
+        self.tarifs = donnees["tarifs"]
+        # Les instructions du modèle restent côté service
+        self.instructions = ""
+        self.checked_at = time.monotonic()
+
+
+_catalogue = None
+_catalogue_lock = threading.Lock()
+
+
+def get_catalogue() -> RemoteCatalogue:
+    global _catalogue
+    with _catalogue_lock:
+        if _catalogue is None or time.monotonic() - _catalogue.checked_at >= CATALOGUE_CHECK_INTERVAL:
+            reponse = http.get("/catalogue")
+            reponse.raise_for_status()
+            _catalogue = RemoteCatalogue(reponse.json())
+        return _catalogue
+
+
+def _post(chemin: str, donnees: Dict[str, Any]) -> Dict[str, Any]:
+    reponse = http.post(chemin, json=donnees)
+    reponse.raise_for_status()
+    return reponse.json()
+
+
+def analyze_question(question: str, client_type: str, urgency: str) -> Tuple[str, str]:
+    resultat = _post("/classify", {"question": question, "client_type": client_type, "urgency": urgency})
+    return resultat["domaine"], resultat["prestation"]
+
+
+def calculate_estimate(domaine: str, prestation: str, urgency: str):
+    resultat = _post("/quote", {"domaine": domaine, "prestation": prestation, "urgency": urgency})
+    return resultat["estimation_basse"], resultat["estimation_haute"], resultat["calcul_details"], resultat["tarifs_utilises"]
+
+
+def get_detailed_analysis(question: str, client_type: str, urgency: str, domaine: str, prestation: str) -> Tuple[str, Dict[str, Any], str]:
+    resultat = _post("/analysis", {"question": question, "client_type": client_type, "urgency": urgency,
+                                   "domaine": domaine, "prestation": prestation})
+    return resultat["detailed_analysis"], resultat["elements_used"], resultat["sources"]
+
+
+def estimate_question(question: str, client_type: str, urgency: str) -> Tuple[str, str, str, Dict[str, Any], str]:
+    resultat = _post("/estimate", {"question": question, "client_type": client_type, "urgency": urgency})
+    return resultat["domaine"], resultat["prestation"], resultat["detailed_analysis"], resultat["elements_used"], resultat["sources"]
+
+
+class DetailedAnalysisStream:
+    """Analyse détaillée transmise au fil de l'eau par /analysis/stream ; mêmes
+    attributs que estimator.DetailedAnalysisStream une fois l'itération terminée."""
+
+    def __init__(self, question: str, client_type: str, urgency: str, domaine: str, prestation: str):
+        self.requete = {"question": question, "client_type": client_type, "urgency": urgency,
+                        "domaine": domaine, "prestation": prestation}
+        self.analysis = "Analyse non disponible."
+        self.elements_used: Dict[str, Any] = {}
+        self.sources = "Aucune source spécifique mentionnée."
+
+    def __iter__(self) -> Iterator[str]:
+        with http.stream("POST", "/analysis/stream", json=self.requete) as reponse:
+            reponse.raise_for_status()
+            for ligne in reponse.iter_lines():
+                if not ligne:
+                    continue
+                donnees = json.loads(ligne)
+                if "text" in donnees:
+                    yield donnees["text"]
+                else:
+                    self.analysis = donnees["analysis"]
+                    self.elements_used = donnees["elements_used"]
+                    self.sources = donnees["sources"]
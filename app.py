@@ -1,224 +1,191 @@
-import streamlit as st
-from openai import OpenAI
+import hashlib
 import os
-import sys
-import importlib.util
-import json
-
-# Configuration du client OpenAI
-client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-
-def load_py_module(file_path, module_name):
-    try:
-        spec = importlib.util.spec_from_file_location(module_name, file_path)
-        module = importlib.util.module_from_spec(spec)
-        sys.modules[module_name] = module
-        spec.loader.exec_module(module)
-        return module
-    except Exception as e:
-        print(f"Erreur lors du chargement du module {module_name}: {e}")
-        return None
+import time
 
-# Chemins des modules à charger
-prestations_path = './prestations-heures.py'
-tarifs_path = './tarifs-prestations.py'
-instructions_path = './chatbot-instructions.py'
-
-prestations_module = load_py_module(prestations_path, 'prestations_heures')
-tarifs_module = load_py_module(tarifs_path, 'tarifs_prestations')
-instructions_module = load_py_module(instructions_path, 'consignes_chatbot')
+import streamlit as st
+from metrics import metrics, start_http_server_from_env
+from response_cache import NullCache, normalize_question
+from speculation import Speculator
+
+# Avec ESTIMATOR_API_URL, l'interface délègue les estimations au service HTTP (api.py)
+if os.getenv("ESTIMATOR_API_URL"):
+    from api_client import (
+        ESTIMATION_MODE,
+        DetailedAnalysisStream,
+        analyze_question,
+        calculate_estimate,
+        estimate_question,
+        get_catalogue,
+        get_detailed_analysis,
+    )
+    # Le service met en cache les réponses de son côté
+    ANALYSIS_CACHED = True
+else:
+    from estimator import (
+        ESTIMATION_MODE,
+        DetailedAnalysisStream,
+        analyze_question,
+        calculate_estimate,
+        estimate_question,
+        get_catalogue,
+        get_detailed_analysis,
+        reponses_cache,
+    )
+    ANALYSIS_CACHED = not isinstance(reponses_cache, NullCache)
 
-# Définition des variables globales
-global prestations, tarifs, instructions
-prestations = prestations_module.get_prestations() if prestations_module else {}
-tarifs = tarifs_module.get_tarifs() if tarifs_module else {}
-instructions = instructions_module.get_chatbot_instructions() if instructions_module else ""
+# Mode spéculatif (optionnel) : la classification, et avec SPECULATIVE_ANALYSIS l'analyse
+# détaillée, démarrent en arrière-plan dès que la saisie est stable depuis
+# SPECULATION_DEBOUNCE secondes ; le clic reprend ce calcul si la saisie n'a pas changé.
+SPECULATIVE_CLASSIFICATION = os.getenv("SPECULATIVE_CLASSIFICATION", "").lower() in ("1", "true", "yes")
+SPECULATIVE_ANALYSIS = os.getenv("SPECULATIVE_ANALYSIS", "").lower() in ("1", "true", "yes")
+SPECULATION_DEBOUNCE = float(os.getenv("SPECULATION_DEBOUNCE", "1.5"))
 
-def analyze_question(question, client_type, urgency):
-    global prestations
-    options = []
-    for domaine, prestations_domaine in prestations.items():
-        prestations_str = ', '.join(prestations_domaine.keys())
-        options.append(f"{domaine}: {prestations_str}")
-    options_str = '\n'.join(options)
+# Endpoint des métriques (METRICS_PORT) ; sans effet aux exécutions suivantes du script
+start_http_server_from_env()
 
-    prompt = f"""En tant qu'assistant juridique de View Avocats, analysez la question suivante et identifiez le domaine juridique et la prestation la plus pertinente parmi les options données.
 
+@st.cache_resource
+def get_speculator():
+    return Speculator(debounce=SPECULATION_DEBOUNCE)
 
-Question : {question}
-Type de client : {client_type}
-Degré d'urgence : {urgency}
 
+def speculate(speculator, question, client_type, urgency):
+    if SPECULATIVE_ANALYSIS and ESTIMATION_MODE != "streaming":
+        estimation = estimate_question(question, client_type, urgency)
+        return {"classification": estimation[:2], "estimate": estimation}
+    classification = analyze_question(question, client_type, urgency)
+    if SPECULATIVE_ANALYSIS and ANALYSIS_CACHED:
+        # Tâche séparée : le clic n'attend que la classification, et le flux affiché
+        # ensuite reprend l'analyse depuis le cache si elle est déjà terminée
+        speculator.warm(get_detailed_analysis, question, client_type, urgency, *classification)
+    return {"classification": classification, "estimate": None}
 
-Options de domaines et prestations :
-{options_str}
 
+def _speculative_result(speculation):
+    if speculation is None:
+        return None
+    try:
+        return speculation.result()
+    except Exception:
+        return None
 
-Répondez avec le domaine et la prestation la plus pertinente, séparés par une virgule."""
 
+def input_fingerprint(question, client_type, urgency):
+    return hashlib.sha256("\x1f".join([normalize_question(question), client_type, urgency, ESTIMATION_MODE]).encode("utf-8")).hexdigest()
 
-    response = client.chat.completions.create(
-        model="gpt-3.5-turbo",
-        messages=[
-            {"role": "system", "content": instructions},
-            {"role": "user", "content": prompt}
-        ]
-    )
 
-    
-    answer = response.choices[0].message.content.strip()
-    parts = answer.split(',')
-    if len(parts) >= 2:
-        return parts[0].strip(), parts[1].strip()
+def compute_estimate(question, client_type, urgency, empreinte, speculation=None):
+    resultat = {"empreinte": empreinte}
+    if ESTIMATION_MODE == "streaming":
+        # L'estimation s'affiche dès la classification ; l'analyse détaillée suit en flux
+        with st.spinner("Analyse en cours..."):
+            anticipe = _speculative_result(speculation)
+            domaine, prestation = anticipe["classification"] if anticipe else analyze_question(question, client_type, urgency)
+            estimation_basse, estimation_haute, calcul_details, tarifs_utilises = calculate_estimate(domaine, prestation, urgency)
+        detailed_analysis = DetailedAnalysisStream(question, client_type, urgency, domaine, prestation)
+        elements_used, sources = {}, None
+        st.success("Estimation calculée. L'analyse détaillée s'affiche ci-dessous :")
     else:
-        return answer, "prestation générale"
-
-
-def calculate_estimate(domaine, prestation, urgency):
-    try:
-        heures = prestations.get(domaine, {}).get(prestation, 10)
-        tarif_horaire = tarifs.get("tarif_horaire_standard")
-        if tarif_horaire is None:
-            raise KeyError("tarif_horaire_standard non trouvé dans tarifs")
-       
-        estimation = heures * tarif_horaire
-
-
-        calcul_details = [f"Heures estimées: {heures}"]
-        calcul_details.append(f"Tarif horaire standard: {tarif_horaire} €")
-        calcul_details.append(f"Estimation initiale: {heures} x {tarif_horaire} = {estimation} €")
+        with st.spinner("Analyse en cours..."):
+            # Étape 1 : Analyse de la question et analyse détaillée
+            anticipe = _speculative_result(speculation)
+            if anticipe and anticipe["estimate"]:
+                domaine, prestation, detailed_analysis, elements_used, sources = anticipe["estimate"]
+            elif anticipe:
+                domaine, prestation = anticipe["classification"]
+                detailed_analysis, elements_used, sources = get_detailed_analysis(question, client_type, urgency, domaine, prestation)
+            else:
+                domaine, prestation, detailed_analysis, elements_used, sources = estimate_question(question, client_type, urgency)
+            st.write(f"Domaine identifié : {domaine}")
+            st.write(f"Prestation recommandée : {prestation}")
 
 
-        if urgency == "Urgent":
-            facteur_urgence = tarifs.get("facteur_urgence", 1.5)
-            estimation *= facteur_urgence
-            calcul_details.append(f"Facteur d'urgence appliqué: x{facteur_urgence}")
-            calcul_details.append(f"Estimation après urgence: {estimation} €")
+            # Étape 2 : Calcul de l'estimation
+            estimation_basse, estimation_haute, calcul_details, tarifs_utilises = calculate_estimate(domaine, prestation, urgency)
 
 
-        forfait = tarifs.get("forfaits", {}).get(prestation)
-        if forfait:
-            calcul_details.append(f"Forfait disponible pour cette prestation: {forfait} €")
-            if forfait < estimation:
-                estimation = forfait
-                calcul_details.append(f"Forfait appliqué car plus avantageux: {forfait} €")
-            else:
-                calcul_details.append("Forfait non appliqué car moins avantageux que l'estimation horaire")
+        # Affichage des résultats
+        st.success("Analyse terminée. Voici les résultats :")
 
+    resultat.update(
+        domaine=domaine, prestation=prestation, estimation_basse=estimation_basse, estimation_haute=estimation_haute,
+        calcul_details=calcul_details, tarifs_utilises=tarifs_utilises, detailed_analysis=detailed_analysis,
+        elements_used=elements_used, sources=sources,
+    )
+    # Un flux n'est conservé qu'une fois entièrement reçu (voir render_estimate)
+    if isinstance(detailed_analysis, str):
+        st.session_state["estimation"] = resultat
+    return resultat
 
-        estimation_basse = round(estimation * 0.8)
-        estimation_haute = round(estimation * 1.2)
-        calcul_details.append(f"Fourchette d'estimation: {estimation_basse} € - {estimation_haute} €")
 
+def render_estimate(resultat, client_type, urgency):
+    debut_rendu = time.perf_counter()
+    col1, col2 = st.columns(2)
 
-        tarifs_utilises = {
-            "tarif_horaire_standard": tarif_horaire,
-            "facteur_urgence": tarifs.get("facteur_urgence") if urgency == "Urgent" else "Non appliqué",
-            "forfait_prestation": forfait if forfait else "Pas de forfait pour cette prestation"
-        }
 
+    with col1:
+        st.subheader("Résumé de l'estimation")
+        st.write(f"**Type de client :** {client_type}")
+        st.write(f"**Degré d'urgence :** {urgency}")
+        st.write(f"**Domaine juridique :** {resultat['domaine']}")
+        st.write(f"**Prestation :** {resultat['prestation']}")
+        st.write(f"**Estimation :** Entre {resultat['estimation_basse']} €HT et {resultat['estimation_haute']} €HT")
 
-        return estimation_basse, estimation_haute, calcul_details, tarifs_utilises
-    except Exception as e:
-        print(f"Erreur dans calculate_estimate: {str(e)}")
-        print(f"tarifs: {tarifs}")
-        print(f"prestations: {prestations}")
-        raise
 
+        st.subheader("Détails du calcul")
+        for detail in resultat["calcul_details"]:
+            st.write(detail)
 
 
-import json
-import re
-from typing import Tuple, Dict, Any
+    with col2:
+        st.subheader("Éléments tarifaires utilisés")
+        st.json(resultat["tarifs_utilises"])
+        elements_zone = st.container()
 
-import json
-import re
-from typing import Tuple, Dict, Any
 
-import json
-import re
-from typing import Tuple, Dict, Any
-import logging
+    st.subheader("Analyse détaillée")
+    detailed_analysis = resultat["detailed_analysis"]
+    if isinstance(detailed_analysis, str):
+        st.write(detailed_analysis)
+    else:
+        st.write_stream(detailed_analysis)
+        resultat.update(detailed_analysis=detailed_analysis.analysis, elements_used=detailed_analysis.elements_used,
+                        sources=detailed_analysis.sources)
+        st.session_state["estimation"] = resultat
 
-# Configuration du logging
-logging.basicConfig(level=logging.DEBUG)
-logger = logging.getLogger(__name__)
 
-def get_detailed_analysis(question: str, client_type: str, urgency: str, domaine: str, prestation: str) -> Tuple[str, Dict[str, Any], str]:
-    prompt = f"""
-    En tant qu'assistant juridique expert, analysez la question suivante et expliquez votre raisonnement pour le choix du domaine juridique et de la prestation.
-    
-    Question : {question}
-    Type de client : {client_type}
-    Degré d'urgence : {urgency}
-    Domaine recommandé : {domaine}
-    Prestation recommandée : {prestation}
+    if resultat["elements_used"]:
+        with elements_zone:
+            st.subheader("Éléments spécifiques pris en compte")
+            st.json(resultat["elements_used"])
 
-    Structurez votre réponse en trois parties distinctes :
-    1. Analyse détaillée : Expliquez votre raisonnement de manière claire et concise.
-    2. Éléments spécifiques utilisés : Fournissez un objet JSON valide et strict, avec des guillemets doubles pour toutes les clés et les valeurs string. 
-       Exemple : {{"domaine": {{"nom": "Droit_du_travail", "description": "Encadre les relations entre employeurs et salariés"}}, "prestation": {{"nom": "Contestation_licenciement", "description": "Assistance juridique pour contester un licenciement"}}}}
-    3. Sources d'information : Listez les sources spécifiques utilisées (fichiers de tarifs, de prestations, ou autres sources internes).
 
-    Assurez-vous que chaque partie est clairement séparée et que le JSON est correctement formaté.
-    """
+    if resultat["sources"]:
+        st.subheader("Sources d'information")
+        st.write(resultat["sources"])
 
-    try:
-        logger.info("Envoi de la requête à l'API OpenAI")
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "Vous êtes un assistant juridique expert qui explique son raisonnement de manière détaillée et transparente."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.5,
-            max_tokens=1000
-        )
-
-        full_response = response.choices[0].message.content.strip()
-        logger.debug(f"Réponse complète de l'API : {full_response}")
-        
-        # Séparation des parties de la réponse
-        parts = re.split(r'\d+\.|\*\*', full_response)
-        parts = [part.strip() for part in parts if part.strip()]
-        logger.debug(f"Parties séparées de la réponse : {parts}")
-
-        analysis = parts[0] if parts else "Analyse non disponible."
-        elements_used = {}
-        sources = "Aucune source spécifique mentionnée."
-
-        if len(parts) > 1:
-            elements_str = parts[1]
-            logger.debug(f"Partie des éléments spécifiques : {elements_str}")
-            # Tentative d'extraction du JSON
-            json_match = re.search(r'(\{.*?\})', elements_str, re.DOTALL)
-            if json_match:
-                try:
-                    elements_used = json.loads(json_match.group(1))
-                    logger.info("JSON extrait avec succès")
-                except json.JSONDecodeError as e:
-                    logger.error(f"Erreur lors du parsing JSON : {e}")
-
-            # Si l'extraction du JSON a échoué, on extrait les informations manuellement
-            if not elements_used:
-                logger.info("Extraction manuelle des informations")
-                domaine_match = re.search(r'domaine .*? est le (.*?),', elements_str)
-                prestation_match = re.search(r'prestation recommandée est (.*?)\.|$', elements_str)
-                
-                elements_used = {
-                    "domaine": {"nom": domaine_match.group(1) if domaine_match else "Non spécifié"},
-                    "prestation": {"nom": prestation_match.group(1) if prestation_match else "Non spécifiée"}
-                }
-
-        if len(parts) > 2:
-            sources = parts[2]
-
-        logger.info("Analyse terminée avec succès")
-        return analysis, elements_used, sources
 
-    except Exception as e:
-        logger.exception(f"Erreur lors de l'appel à l'API ou du traitement de la réponse : {e}")
-        return "Une erreur s'est produite lors de l'analyse.", {"error": "Erreur lors de l'analyse", "details": str(e)}, "Non disponible en raison d'une erreur."
+    # Option alternative
+    st.markdown("---")
+    st.markdown("### 💡 Alternative Recommandée")
+    st.info("""
+        **Consultation initiale d'une heure**
+        - Tarif fixe : 100 € HT
+        - Idéal pour un premier avis juridique
+        - Évaluation approfondie de votre situation
+        - Recommandations personnalisées
+    """)
+
+
+    # Boutons d'action
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button("Demander un devis détaillé"):
+            st.success("Nous vous contacterons pour un devis détaillé.")
+    with col2:
+        if st.button("Réserver une consultation initiale"):
+            st.success("Nous vous contacterons pour planifier la consultation.")
+    metrics.observe("render", time.perf_counter() - debut_rendu)
 
 
 def main():
@@ -226,6 +193,10 @@ def main():
     st.title("🏛️ View Avocats - Estimateur de devis")
     st.write("Obtenez une estimation rapide pour vos besoins juridiques.")
 
+    # Catalogue partagé par toutes les sessions, rechargé uniquement si les fichiers changent
+    catalogue = get_catalogue()
+    prestations, tarifs, instructions = catalogue.prestations, catalogue.tarifs, catalogue.instructions
+
     # Vérification initiale des données chargées
     if not prestations or not tarifs:
         st.error("Erreur : Données non chargées correctement")
@@ -247,98 +218,47 @@ def main():
     question = st.text_area("Expliquez brièvement votre cas :", height=150)
 
 
-    if st.button("Obtenir une estimation", key="estimate_button"):
-        if question:
-            try:
-                with st.spinner("Analyse en cours..."):
-                    # Étape 1 : Analyse de la question
-                    domaine, prestation = analyze_question(question, client_type, urgency)
-                    st.write(f"Domaine identifié : {domaine}")
-                    st.write(f"Prestation recommandée : {prestation}")
-
-
-                    # Étape 2 : Calcul de l'estimation
-                    estimation_basse, estimation_haute, calcul_details, tarifs_utilises = calculate_estimate(domaine, prestation, urgency)
-
-
-                    # Étape 3 : Obtention de l'analyse détaillée
-                    detailed_analysis, elements_used, sources = get_detailed_analysis(question, client_type, urgency, domaine, prestation)
-
-
-                # Affichage des résultats
-                st.success("Analyse terminée. Voici les résultats :")
-
-
-                col1, col2 = st.columns(2)
-
-
-                with col1:
-                    st.subheader("Résumé de l'estimation")
-                    st.write(f"**Type de client :** {client_type}")
-                    st.write(f"**Degré d'urgence :** {urgency}")
-                    st.write(f"**Domaine juridique :** {domaine}")
-                    st.write(f"**Prestation :** {prestation}")
-                    st.write(f"**Estimation :** Entre {estimation_basse} €HT et {estimation_haute} €HT")
-
-
-                    st.subheader("Détails du calcul")
-                    for detail in calcul_details:
-                        st.write(detail)
-
-
-                with col2:
-                    st.subheader("Éléments tarifaires utilisés")
-                    st.json(tarifs_utilises)
-
-
-                    if elements_used:
-                        st.subheader("Éléments spécifiques pris en compte")
-                        st.json(elements_used)
-
-
-                st.subheader("Analyse détaillée")
-                st.write(detailed_analysis)
-
-
-                if sources:
-                    st.subheader("Sources d'information")
-                    st.write(sources)
-
-
-                # Option alternative
-                st.markdown("---")
-                st.markdown("### 💡 Alternative Recommandée")
-                st.info("""
-                    **Consultation initiale d'une heure**
-                    - Tarif fixe : 100 € HT
-                    - Idéal pour un premier avis juridique
-                    - Évaluation approfondie de votre situation
-                    - Recommandations personnalisées
-                """)
-
-
-                # Boutons d'action
-                col1, col2 = st.columns(2)
-                with col1:
-                    if st.button("Demander un devis détaillé"):
-                        st.success("Nous vous contacterons pour un devis détaillé.")
-                with col2:
-                    if st.button("Réserver une consultation initiale"):
-                        st.success("Nous vous contacterons pour planifier la consultation.")
+    # Résultat de la dernière estimation, conservé entre les réexécutions du script :
+    # les boutons de suivi ne relancent que l'affichage. Une saisie modifiée invalide le résultat.
+    empreinte = input_fingerprint(question, client_type, urgency)
+    resultat = st.session_state.get("estimation")
+    if resultat is not None and resultat["empreinte"] != empreinte:
+        resultat = None
 
+    try:
+        if st.button("Obtenir une estimation", key="estimate_button"):
+            if not question:
+                st.warning("Veuillez décrire votre cas avant de demander une estimation.")
+            elif resultat is None:
+                speculation = None
+                if SPECULATIVE_CLASSIFICATION:
+                    speculation = get_speculator().claim(st.session_state.pop("speculation", None), empreinte)
+                resultat = compute_estimate(question, client_type, urgency, empreinte, speculation)
+            else:
+                metrics.increment("session_results_reused")
+        elif resultat is not None:
+            metrics.increment("session_results_reused")
+        elif SPECULATIVE_CLASSIFICATION and question:
+            # Saisie modifiée : le calcul anticipé précédent est remplacé
+            job = st.session_state.get("speculation")
+            if job is None or job.fingerprint != empreinte:
+                speculator = get_speculator()
+                speculator.cancel(job)
+                st.session_state["speculation"] = speculator.schedule(empreinte, speculate, speculator, question, client_type, urgency)
+
+        if resultat is not None:
+            render_estimate(resultat, client_type, urgency)
 
-            except Exception as e:
-                st.error(f"Une erreur s'est produite : {str(e)}")
-                st.write("Détails de l'erreur pour le débogage :")
-                st.write(e)
-                st.write("État des variables globales :")
-                st.json({
-                    "prestations": {k: list(v.keys()) for k, v in prestations.items()},
-                    "tarifs": {k: v for k, v in tarifs.items() if k != 'forfaits'},
-                    "instructions": instructions[:100] + "..." if instructions else "Vide"
-                })
-        else:
-            st.warning("Veuillez décrire votre cas avant de demander une estimation.")
+    except Exception as e:
+        st.error(f"Une erreur s'est produite : {str(e)}")
+        st.write("Détails de l'erreur pour le débogage :")
+        st.write(e)
+        st.write("État des variables globales :")
+        st.json({
+            "prestations": {k: list(v.keys()) for k, v in prestations.items()},
+            "tarifs": {k: v for k, v in tarifs.items() if k != 'forfaits'},
+            "instructions": instructions[:100] + "..." if instructions else "Vide"
+        })
 
 
     # Informations supplémentaires
@@ -0,0 +1,139 @@
+"""Ré-estimation par lots d'un historique de questions.
+
+Lit un fichier CSV ou JSONL (colonnes question, client_type, urgency et id optionnel),
+fait passer chaque ligne dans le pipeline d'estimation et écrit les résultats au fil
+de l'eau dans un fichier JSONL. Les identifiants traités sont consignés dans un
+fichier de reprise : relancer la même commande reprend là où le traitement s'est arrêté.
+
+    python batch.py questions.csv resultats.jsonl --concurrency 8
+"""
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, Iterator, Set
+
+import estimator
+from metrics import start_http_server_from_env
+
+logger = logging.getLogger("batch")
+
+FIN = object()
+
+
+def iter_questions(path: str) -> Iterator[Dict[str, Any]]:
+    """Lit le fichier d'entrée ligne à ligne, sans le charger en mémoire."""
+    with open(path, encoding="utf-8", newline="") as f:
+        if path.endswith(".jsonl"):
+            lignes = (json.loads(ligne) for ligne in f if ligne.strip())
+        else:
+            lignes = csv.DictReader(f)
+        for numero, ligne in enumerate(lignes, start=1):
+            yield {
+                "id": str(ligne.get("id") or numero),
+                "question": ligne.get("question", ""),
+                "client_type": ligne.get("client_type") or "Particulier",
+                "urgency": ligne.get("urgency") or "Normal",
+            }
+
+
+def load_checkpoint(path: str) -> Set[str]:
+    if not os.path.exists(path):
+        return set()
+    with open(path, encoding="utf-8") as f:
+        return {ligne.strip() for ligne in f if ligne.strip()}
+
+
+async def estimate_row(ligne: Dict[str, Any], skip_analysis: bool) -> Dict[str, Any]:
+    question, client_type, urgency = ligne["question"], ligne["client_type"], ligne["urgency"]
+    if skip_analysis:
+        domaine, prestation = await estimator.async_analyze_question(question, client_type, urgency)
+        detailed_analysis, elements_used, sources = None, None, None
+    else:
+        domaine, prestation, detailed_analysis, elements_used, sources = await estimator.async_estimate_question(question, client_type, urgency)
+    estimation_basse, estimation_haute, calcul_details, tarifs_utilises = estimator.calculate_estimate(domaine, prestation, urgency)
+    return {
+        **ligne,
+        "domaine": domaine,
+        "prestation": prestation,
+        "estimation_basse": estimation_basse,
+        "estimation_haute": estimation_haute,
+        "calcul_details": calcul_details,
+        "tarifs_utilises": tarifs_utilises,
+        "analysis": detailed_analysis,
+        "elements_used": elements_used,
+        "sources": sources,
+    }
+
+
+async def run_batch(input_path: str, output_path: str, checkpoint_path: str, concurrency: int = 8, skip_analysis: bool = False) -> Dict[str, int]:
+    deja_traites = load_checkpoint(checkpoint_path)
+    compteurs = {"traites": 0, "ignores": 0, "erreurs": 0}
+    # File bornée : la lecture du fichier avance au rythme des estimations
+    file_attente: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+    verrou_ecriture = asyncio.Lock()
+    debut = time.perf_counter()
+
+    with open(output_path, "a", encoding="utf-8") as sortie, open(checkpoint_path, "a", encoding="utf-8") as reprise:
+
+        async def worker():
+            while True:
+                ligne = await file_attente.get()
+                if ligne is FIN:
+                    return
+                try:
+                    resultat = await estimate_row(ligne, skip_analysis)
+                except Exception as e:
+                    # Non consignée dans le fichier de reprise : la ligne sera retentée
+                    logger.error("Échec de l'estimation pour la ligne %s : %s", ligne['id'], e)
+                    compteurs["erreurs"] += 1
+                    continue
+                async with verrou_ecriture:
+                    sortie.write(json.dumps(resultat, ensure_ascii=False) + "\n")
+                    sortie.flush()
+                    reprise.write(ligne["id"] + "\n")
+                    reprise.flush()
+                    compteurs["traites"] += 1
+                    if compteurs["traites"] % 50 == 0:
+                        logger.info(f"{compteurs['traites']} lignes traitées en {time.perf_counter() - debut:.1f}s")
+
+        workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+        for ligne in iter_questions(input_path):
+            if ligne["id"] in deja_traites:
+                compteurs["ignores"] += 1
+                continue
+            await file_attente.put(ligne)
+        for _ in workers:
+            await file_attente.put(FIN)
+        await asyncio.gather(*workers)
+
+    logger.info(f"Traitement terminé en {time.perf_counter() - debut:.1f}s : {compteurs}")
+    logger.info(f"Cache des réponses : {estimator.reponses_cache.stats()}")
+    return compteurs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ré-estimation par lots de questions (CSV ou JSONL).")
+    parser.add_argument("input", help="Fichier CSV ou JSONL avec les colonnes question, client_type, urgency (et id optionnel)")
+    parser.add_argument("output", help="Fichier JSONL de résultats, complété au fil de l'eau")
+    parser.add_argument("--checkpoint", help="Fichier de reprise (par défaut : <output>.checkpoint)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Nombre maximal d'estimations simultanées")
+    parser.add_argument("--skip-analysis", action="store_true", help="Classification et chiffrage uniquement, sans analyse détaillée")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.INFO)
+    start_http_server_from_env()
+    asyncio.run(run_batch(
+        args.input,
+        args.output,
+        args.checkpoint or args.output + ".checkpoint",
+        concurrency=args.concurrency,
+        skip_analysis=args.skip_analysis,
+    ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+"""Banc de mesure hors ligne du pipeline d'estimation.
+
+Le client OpenAI du module estimator est remplacé par un faux client qui rejoue les
+réponses enregistrées dans bench_fixtures.json avec une latence tirée d'une loi
+log-normale. Chaque cible est exécutée à concurrence fixée ; le rapport donne le
+débit, les quantiles de latence et la mémoire allouée par estimation, et peut être
+enregistré comme référence puis comparé aux exécutions suivantes.
+
+    python bench.py --iterations 200 --concurrency 8 --save-baseline bench_baseline.json
+    python bench.py --iterations 200 --concurrency 8 --compare bench_baseline.json
+"""
+import argparse
+import json
+import logging
+import math
+import platform
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List
+
+import estimator
+from metrics import percentile
+from response_cache import NullCache
+
+# Latence médiane (secondes) et dispersion log-normale des réponses simulées
+DEFAULT_LATENCY = {
+    "classification": (0.5, 0.35),
+    "detailed_analysis": (2.0, 0.4),
+    "structured": (2.5, 0.4),
+}
+TARGETS = ("analyze_question", "calculate_estimate", "get_detailed_analysis", "detailed_analysis_stream", "pipeline")
+
+
+class FakeCompletions:
+    """Rejoue des réponses enregistrées avec l'interface de client.chat.completions."""
+
+    def __init__(self, fixtures: Dict[str, Any], latency: Dict[str, tuple], scale: float = 1.0, seed: int = 0):
+        self.fixtures = fixtures
+        self.latency = latency
+        self.scale = scale
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = {etape: 0 for etape in latency}
+
+    def _draw(self, etape: str):
+        mediane, dispersion = self.latency[etape]
+        with self._lock:
+            self.calls[etape] += 1
+            fixture = self._random.choice(self.fixtures[etape])
+            delai = self._random.lognormvariate(math.log(mediane), dispersion) * self.scale if mediane > 0 else 0.0
+        return fixture, delai
+
+    def create(self, **kwargs):
+        if kwargs.get("tools"):
+            etape = "structured"
+        elif "séparés par une virgule" in kwargs["messages"][-1]["content"]:
+            etape = "classification"
+        else:
+            etape = "detailed_analysis"
+        fixture, delai = self._draw(etape)
+        usage = SimpleNamespace(prompt_tokens_details=None, **fixture["usage"])
+
+        if kwargs.get("stream"):
+            return self._stream(fixture["content"], usage, delai)
+
+        time.sleep(delai)
+        if etape == "structured":
+            appel = SimpleNamespace(function=SimpleNamespace(name="enregistrer_estimation", arguments=json.dumps(fixture["arguments"], ensure_ascii=False)))
+            message = SimpleNamespace(content=None, tool_calls=[appel])
+        else:
+            message = SimpleNamespace(content=fixture["content"], tool_calls=None)
+        choix = SimpleNamespace(message=message, logprobs=None)
+        if kwargs.get("logprobs"):
+            # Confiance simulée : un seul jeton dont la probabilité est tirée entre 0,3 et 1
+            with self._lock:
+                probabilite = self._random.uniform(0.3, 1.0)
+            choix.logprobs = SimpleNamespace(content=[SimpleNamespace(token=fixture["content"], logprob=math.log(probabilite))])
+        return SimpleNamespace(model=kwargs.get("model"), usage=usage, choices=[choix])
+
+    def _stream(self, contenu: str, usage, delai: float):
+        # Premier fragment après 30 % du délai, le reste réparti sur les fragments suivants
+        fragments = [contenu[i:i + 16] for i in range(0, len(contenu), 16)]
+        time.sleep(delai * 0.3)
+        for fragment in fragments:
+            yield SimpleNamespace(usage=None, choices=[SimpleNamespace(delta=SimpleNamespace(content=fragment))])
+            time.sleep(delai * 0.7 / len(fragments))
+        yield SimpleNamespace(model=None, usage=usage, choices=[])
+
+
+class FakeOpenAI:
+    def __init__(self, completions: FakeCompletions):
+        self.chat = SimpleNamespace(completions=completions)
+
+
+def _targets(fixtures: Dict[str, Any]) -> Dict[str, Callable[[Dict[str, str], int], Any]]:
+    classifications = [estimator._parse_classification(f["content"]) for f in fixtures["classification"]]
+
+    def classification(i):
+        return classifications[i % len(classifications)]
+
+    def pipeline(q, i):
+        domaine, prestation, *_ = estimator.estimate_question(q["question"], q["client_type"], q["urgency"])
+        return estimator.calculate_estimate(domaine, prestation, q["urgency"])
+
+    return {
+        "analyze_question": lambda q, i: estimator.analyze_question(q["question"], q["client_type"], q["urgency"]),
+        "calculate_estimate": lambda q, i: estimator.calculate_estimate(*classification(i), q["urgency"]),
+        "get_detailed_analysis": lambda q, i: estimator.get_detailed_analysis(q["question"], q["client_type"], q["urgency"], *classification(i)),
+        "detailed_analysis_stream": lambda q, i: "".join(estimator.DetailedAnalysisStream(q["question"], q["client_type"], q["urgency"], *classification(i))),
+        "pipeline": pipeline,
+    }
+
+
+def run_target(fonction, questions: List[Dict[str, str]], iterations: int, concurrency: int) -> Dict[str, float]:
+    latences = []
+
+    def une_execution(i):
+        debut = time.perf_counter()
+        fonction(questions[i % len(questions)], i)
+        latences.append(time.perf_counter() - debut)
+
+    debut = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(une_execution, range(iterations)))
+    duree = time.perf_counter() - debut
+    return {
+        "iterations": iterations,
+        "concurrency": concurrency,
+        "throughput_per_s": iterations / duree if duree else 0.0,
+        "mean_s": sum(latences) / len(latences),
+        "p50_s": percentile(latences, 0.5),
+        "p95_s": percentile(latences, 0.95),
+        "p99_s": percentile(latences, 0.99),
+    }
+
+
+def measure_allocations(fonction, questions: List[Dict[str, str]], iterations: int) -> float:
+    """Pic moyen de mémoire allouée (Kio) par appel, mesuré séquentiellement."""
+    pics = []
+    tracemalloc.start()
+    try:
+        for i in range(iterations):
+            tracemalloc.reset_peak()
+            avant, _ = tracemalloc.get_traced_memory()
+            fonction(questions[i % len(questions)], i)
+            _, pic = tracemalloc.get_traced_memory()
+            pics.append((pic - avant) / 1024)
+    finally:
+        tracemalloc.stop()
+    return sum(pics) / len(pics) if pics else 0.0
+
+
+def compare(resultats: Dict[str, Any], reference: Dict[str, Any], tolerance: float) -> List[str]:
+    regressions = []
+    for cible, mesure in resultats["targets"].items():
+        base = reference.get("targets", {}).get(cible)
+        if not base:
+            continue
+        for cle in ("p50_s", "p95_s", "alloc_kib_per_call"):
+            if base.get(cle) and mesure[cle] > base[cle] * (1 + tolerance):
+                regressions.append(f"{cible}.{cle} : {base[cle]:.4f} -> {mesure[cle]:.4f}")
+        if base.get("throughput_per_s") and mesure["throughput_per_s"] < base["throughput_per_s"] * (1 - tolerance):
+            regressions.append(f"{cible}.throughput_per_s : {base['throughput_per_s']:.2f} -> {mesure['throughput_per_s']:.2f}")
+    return regressions
+
+
+def _parse_latency(valeurs: List[str]) -> Dict[str, tuple]:
+    latence = dict(DEFAULT_LATENCY)
+    for valeur in valeurs or []:
+        etape, parametres = valeur.split("=", 1)
+        mediane, _, dispersion = parametres.partition(":")
+        latence[etape] = (float(mediane), float(dispersion or latence[etape][1]))
+    return latence
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Banc de mesure hors ligne du pipeline d'estimation.")
+    parser.add_argument("--fixtures", default="bench_fixtures.json")
+    parser.add_argument("--targets", nargs="+", choices=TARGETS, default=list(TARGETS))
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--alloc-iterations", type=int, default=20, help="Appels séquentiels pour la mesure mémoire")
+    parser.add_argument("--mode", choices=("structured", "two_calls", "streaming"), default=estimator.ESTIMATION_MODE)
+    parser.add_argument("--latency", action="append", metavar="ETAPE=MEDIANE[:SIGMA]",
+                        help="Latence simulée, par exemple classification=0.8:0.3 (répétable)")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="Multiplie toutes les latences simulées")
+    parser.add_argument("--with-cache", action="store_true", help="Conserver le cache des réponses (désactivé par défaut)")
+    parser.add_argument("--no-local", action="store_true", help="Désactiver la classification locale")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save-baseline", metavar="FICHIER")
+    parser.add_argument("--compare", metavar="FICHIER")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Écart relatif toléré avant de signaler une régression")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    with open(args.fixtures, encoding="utf-8") as f:
+        fixtures = json.load(f)
+    latence = _parse_latency(args.latency)
+
+    completions = FakeCompletions(fixtures, latence, scale=args.latency_scale, seed=args.seed)
+    estimator.client = FakeOpenAI(completions)
+    estimator.ESTIMATION_MODE = args.mode
+    if not args.with_cache:
+        estimator.reponses_cache = NullCache()
+    if args.no_local:
+        estimator.LOCAL_CLASSIFICATION_THRESHOLD = float("inf")
+
+    cibles = _targets(fixtures)
+    resultats = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "settings": {k: v for k, v in vars(args).items() if k not in ("save_baseline", "compare")},
+        "latency": latence,
+        "targets": {},
+    }
+    for nom in args.targets:
+        mesure = run_target(cibles[nom], fixtures["questions"], args.iterations, args.concurrency)
+        mesure["alloc_kib_per_call"] = measure_allocations(cibles[nom], fixtures["questions"], args.alloc_iterations)
+        resultats["targets"][nom] = mesure
+        print(f"{nom:26} {mesure['throughput_per_s']:9.1f}/s  p50 {mesure['p50_s'] * 1000:9.2f}ms  "
+              f"p95 {mesure['p95_s'] * 1000:9.2f}ms  p99 {mesure['p99_s'] * 1000:9.2f}ms  "
+              f"{mesure['alloc_kib_per_call']:8.1f} Kio/appel")
+    resultats["model_calls"] = dict(completions.calls)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(resultats, f, ensure_ascii=False, indent=2)
+        print(f"Référence enregistrée dans {args.save_baseline}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            reference = json.load(f)
+        regressions = compare(resultats, reference, args.tolerance)
+        if regressions:
+            print("Régressions par rapport à la référence :")
+            for regression in regressions:
+                print(f"  - {regression}")
+            sys.exit(1)
+        print("Aucune régression par rapport à la référence.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+import math
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+MOTS_VIDES = {
+    "a", "au", "aux", "avec", "ce", "ces", "cette", "d", "dans", "de", "des", "du", "elle", "en", "est",
+    "et", "il", "j", "je", "l", "la", "le", "les", "leur", "m", "ma", "mais", "me", "mes", "mon", "n",
+    "ne", "nous", "on", "ou", "par", "pas", "pour", "qu", "que", "qui", "s", "sa", "se", "ses", "son",
+    "sur", "t", "ta", "te", "un", "une", "vous", "y", "suis", "ai", "fait", "faire", "quoi", "comment", "combien",
+    # Négations : "ne ... plus" ne doit pas devenir "plu" après réduction du pluriel
+    "plus", "jamais", "rien",
+}
+
+# Sigles du catalogue (PLU, SCI, CDD...) : comparés tels quels au texte brut, en
+# majuscules, pour ne pas être confondus avec des mots courants une fois en minuscules
+SIGLE = re.compile(r"\b[A-Z]{2,6}\b")
+
+
+def fold(texte: str) -> str:
+    """Minuscules sans accents, apostrophes, tirets et soulignés remplacés par des espaces."""
+    texte = unicodedata.normalize("NFKD", texte or "")
+    texte = "".join(c for c in texte if not unicodedata.combining(c)).lower()
+    return re.sub(r"[^a-z0-9]+", " ", texte).strip()
+
+
+def _racine(mot: str) -> str:
+    if len(mot) > 3 and mot[-1] in "sx":
+        mot = mot[:-1]
+    return mot
+
+
+def tokenize(texte: str) -> List[str]:
+    # Les sigles en majuscules sont ajoutés tels quels, à côté de leur forme en minuscules
+    return [_racine(mot) for mot in fold(texte).split() if mot not in MOTS_VIDES] + SIGLE.findall(texte or "")
+
+
+def _expression(libelle: str) -> Tuple[str, ...]:
+    if SIGLE.fullmatch(libelle):
+        return (libelle,)
+    return tuple(_racine(mot) for mot in fold(libelle).split() if mot not in MOTS_VIDES)
+
+
+def _contient(tokens: List[str], expression: Tuple[str, ...]) -> bool:
+    n = len(expression)
+    return any(tuple(tokens[i:i + n]) == expression for i in range(len(tokens) - n + 1))
+
+
+class CatalogueIndex:
+    """Classifieur local TF-IDF sur les libellés du catalogue et leurs synonymes.
+
+    Construit une seule fois à partir de get_prestations(), il renvoie la prestation la
+    plus probable avec un score de confiance entre 0 et 1 sans appel réseau.
+    """
+
+    def __init__(self, prestations: Dict[str, Dict[str, float]], synonymes: Optional[Dict[str, Dict[str, List[str]]]] = None):
+        synonymes = synonymes or {}
+        self.entrees: List[Tuple[str, str]] = []
+        self.expressions: List[List[Tuple[str, ...]]] = []
+        documents: List[Counter] = []
+
+        for domaine, prestations_domaine in prestations.items():
+            for prestation in prestations_domaine:
+                libelles = [prestation] + list(synonymes.get(domaine, {}).get(prestation, []))
+                expressions = [_expression(libelle) for libelle in libelles]
+                self.entrees.append((domaine, prestation))
+                self.expressions.append([e for e in expressions if e])
+                document = Counter(t for e in expressions for t in e)
+                # Le domaine compte moins que la prestation elle-même
+                document.update({t: 0.5 for t in _expression(domaine)})
+                documents.append(document)
+
+        nombre_documents = len(documents)
+        frequences = Counter(t for document in documents for t in document)
+        self.idf = {t: math.log((1 + nombre_documents) / (1 + df)) + 1 for t, df in frequences.items()}
+
+        self.postings: Dict[str, List[Tuple[int, float]]] = defaultdict(list)
+        for i, document in enumerate(documents):
+            poids = {t: tf * self.idf[t] for t, tf in document.items()}
+            norme = math.sqrt(sum(p * p for p in poids.values())) or 1.0
+            for t, p in poids.items():
+                self.postings[t].append((i, p / norme))
+
+    def rank(self, question: str, k: int = 5) -> List[Tuple[str, str, float]]:
+        """Les k prestations les plus proches de la question, avec leur score brut."""
+        tokens = tokenize(question)
+        if not tokens:
+            return []
+        requete = Counter(tokens)
+        poids_requete = {t: tf * self.idf[t] for t, tf in requete.items() if t in self.idf}
+        norme = math.sqrt(sum(p * p for p in poids_requete.values())) or 1.0
+
+        scores: Dict[int, float] = defaultdict(float)
+        for t, p in poids_requete.items():
+            for i, poids_document in self.postings[t]:
+                scores[i] += (p / norme) * poids_document
+
+        # Bonus pour les expressions complètes retrouvées dans la question
+        for i in list(scores):
+            longueurs = [len(e) for e in self.expressions[i] if _contient(tokens, e)]
+            if longueurs:
+                n = max(longueurs)
+                scores[i] += 1 - 1 / (1 + n)
+
+        meilleurs = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(self.entrees[i][0], self.entrees[i][1], score) for i, score in meilleurs]
+
+    def classify(self, question: str) -> Tuple[Optional[str], Optional[str], float]:
+        """(domaine, prestation, confiance) ; la confiance combine la présence d'une
+        expression du catalogue et l'écart avec la deuxième prestation candidate."""
+        candidats = self.rank(question, k=2)
+        if not candidats:
+            return None, None, 0.0
+        domaine, prestation, premier = candidats[0]
+        second = candidats[1][2] if len(candidats) > 1 else 0.0
+        i = self.entrees.index((domaine, prestation))
+        expression_trouvee = any(_contient(tokenize(question), e) for e in self.expressions[i])
+        ecart = 1 - second / premier if premier else 0.0
+        confiance = (0.5 if expression_trouvee else 0.0) + 0.5 * ecart
+        return domaine, prestation, round(confiance, 3)
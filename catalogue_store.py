@@ -0,0 +1,297 @@
+"""Catalogues de prestations et de tarifs compilés.
+
+prestations-heures.py et tarifs-prestations.py sont validés puis compilés en un
+instantané SQLite nommé d'après l'empreinte de son contenu. Un manifeste associe
+chaque cabinet (office) à la version publiée de son catalogue. Les instantanés sont
+lus une fois, en lecture seule, puis servis depuis la mémoire ; une version chargée
+est partagée par tous les cabinets qui la publient.
+
+    python catalogue_store.py check
+    python catalogue_store.py build --store .catalogue --office paris
+    python catalogue_store.py list --store .catalogue
+"""
+import argparse
+import difflib
+import hashlib
+import importlib.util
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from catalogue_index import fold
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_VERSION = 1
+MANIFEST = "offices.json"
+# Clé réservée marquant l'existence d'une section de tarifs imbriquée
+SECTION_MARKER = ""
+
+
+class CatalogueConfigurationError(RuntimeError):
+    """CATALOGUE_STORE ne permet pas de charger le catalogue du cabinet configuré."""
+
+
+class CatalogueValidationError(ValueError):
+    def __init__(self, erreurs: List[str]):
+        super().__init__("Catalogue invalide :\n" + "\n".join(f"  - {e}" for e in erreurs))
+        self.erreurs = erreurs
+
+
+def _est_montant(valeur: Any) -> bool:
+    return isinstance(valeur, (int, float)) and not isinstance(valeur, bool) and valeur > 0
+
+
+def _prestation_proche(cle: str, prestations: Dict[str, Dict[str, float]]) -> Optional[str]:
+    """Prestation dont le libellé est contenu dans la clé de forfait, ou la plus proche."""
+    candidates = {fold(p).replace(" ", "_"): f"{d}/{p}" for d, ps in prestations.items() for p in ps}
+    cle_pliee = fold(cle).replace(" ", "_")
+    contenues = [c for c in candidates if c in cle_pliee or cle_pliee in c]
+    if contenues:
+        return candidates[max(contenues, key=len)]
+    proches = difflib.get_close_matches(cle_pliee, list(candidates), n=1, cutoff=0.6)
+    return candidates[proches[0]] if proches else None
+
+
+def validate_catalogue(prestations: Dict[str, Dict[str, float]], tarifs: Dict[str, Any], strict: bool = False) -> Tuple[List[str], List[str]]:
+    """Contrôle la structure et les références croisées ; renvoie (erreurs, avertissements).
+
+    Un forfait sans prestation correspondante n'est jamais appliqué : c'est un
+    avertissement, ou une erreur avec strict=True.
+    """
+    erreurs, avertissements = [], []
+    if not prestations:
+        erreurs.append("Aucune prestation")
+    vues: Dict[str, str] = {}
+    for domaine, prestations_domaine in prestations.items():
+        if not isinstance(prestations_domaine, dict) or not prestations_domaine:
+            erreurs.append(f"Domaine {domaine} : aucune prestation")
+            continue
+        for prestation, heures in prestations_domaine.items():
+            if not _est_montant(heures):
+                erreurs.append(f"{domaine}/{prestation} : nombre d'heures invalide ({heures!r})")
+            if prestation in vues:
+                avertissements.append(f"Prestation {prestation} présente dans {vues[prestation]} et {domaine}")
+            vues[prestation] = domaine
+
+    if not _est_montant(tarifs.get("tarif_horaire_standard")):
+        erreurs.append(f"tarif_horaire_standard invalide ({tarifs.get('tarif_horaire_standard')!r})")
+    facteur = tarifs.get("facteur_urgence", 1.5)
+    if not _est_montant(facteur) or facteur < 1:
+        erreurs.append(f"facteur_urgence invalide ({facteur!r})")
+
+    references = erreurs if strict else avertissements
+    for cle, montant in tarifs.get("forfaits", {}).items():
+        if not _est_montant(montant):
+            erreurs.append(f"Forfait {cle} : montant invalide ({montant!r})")
+        if cle not in vues:
+            proche = _prestation_proche(cle, prestations)
+            suggestion = f" (prestation proche : {proche})" if proche else ""
+            references.append(f"Forfait {cle} sans prestation correspondante, jamais appliqué{suggestion}")
+    for cle, montant in tarifs.get("frais_additionnels", {}).items():
+        if not _est_montant(montant):
+            erreurs.append(f"Frais {cle} : montant invalide ({montant!r})")
+    return erreurs, avertissements
+
+
+def _heures(valeur: float) -> float:
+    # Les heures sont stockées en REAL : 8.0 et 8 désignent le même contenu
+    return int(valeur) if float(valeur).is_integer() else valeur
+
+
+def content_hash(prestations: Dict[str, Dict[str, float]], tarifs: Dict[str, Any]) -> str:
+    canonique = {d: {p: _heures(h) for p, h in ps.items()} for d, ps in prestations.items()}
+    contenu = json.dumps({"prestations": canonique, "tarifs": tarifs}, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(contenu.encode("utf-8")).hexdigest()[:16]
+
+
+def compile_catalogue(prestations: Dict[str, Dict[str, float]], tarifs: Dict[str, Any], directory: str, strict: bool = False) -> str:
+    """Valide et écrit l'instantané ; renvoie sa version. Un contenu déjà compilé n'est pas réécrit."""
+    erreurs, avertissements = validate_catalogue(prestations, tarifs, strict)
+    if erreurs:
+        raise CatalogueValidationError(erreurs)
+    for avertissement in avertissements:
+        logger.warning("%s", avertissement)
+
+    version = content_hash(prestations, tarifs)
+    chemin = os.path.join(directory, f"{version}.sqlite3")
+    if os.path.exists(chemin):
+        return version
+    os.makedirs(directory, exist_ok=True)
+    temporaire = f"{chemin}.{os.getpid()}.tmp"
+    conn = sqlite3.connect(temporaire)
+    try:
+        conn.executescript("""
+            CREATE TABLE meta (cle TEXT PRIMARY KEY, valeur TEXT NOT NULL);
+            CREATE TABLE prestations (position INTEGER PRIMARY KEY, domaine TEXT NOT NULL, prestation TEXT NOT NULL, heures REAL NOT NULL);
+            CREATE TABLE tarifs (section TEXT NOT NULL, cle TEXT NOT NULL, valeur TEXT NOT NULL, PRIMARY KEY (section, cle));
+            CREATE TABLE controles (niveau TEXT NOT NULL, message TEXT NOT NULL);
+        """)
+        conn.executemany("INSERT INTO meta VALUES (?, ?)", [
+            ("schema_version", str(SCHEMA_VERSION)),
+            ("version", version),
+            ("compiled_at", time.strftime("%Y-%m-%dT%H:%M:%S")),
+        ])
+        conn.executemany("INSERT INTO prestations VALUES (?, ?, ?, ?)", [
+            (i, domaine, prestation, heures)
+            for i, (domaine, prestation, heures) in enumerate((d, p, h) for d, ps in prestations.items() for p, h in ps.items())
+        ])
+        # Sections imbriquées (forfaits, frais_additionnels) à plat ; section vide pour les valeurs simples
+        lignes = []
+        for cle, valeur in tarifs.items():
+            if isinstance(valeur, dict):
+                lignes.extend((cle, sous_cle, json.dumps(v, ensure_ascii=False)) for sous_cle, v in valeur.items())
+                # Marqueur de section : une section vide ("forfaits": {}) existe aussi au chargement
+                lignes.append((cle, SECTION_MARKER, "{}"))
+            else:
+                lignes.append(("", cle, json.dumps(valeur, ensure_ascii=False)))
+        conn.executemany("INSERT INTO tarifs VALUES (?, ?, ?)", lignes)
+        conn.executemany("INSERT INTO controles VALUES ('avertissement', ?)", [(a,) for a in avertissements])
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(temporaire, chemin)
+    return version
+
+
+class CatalogueSnapshot:
+    """Instantané compilé, ouvert en lecture seule ; l'empreinte est revérifiée au chargement."""
+
+    def __init__(self, path: str):
+        self.path = path
+        debut = time.perf_counter()
+        conn = sqlite3.connect(f"file:{path}?mode=ro&immutable=1", uri=True)
+        try:
+            meta = dict(conn.execute("SELECT cle, valeur FROM meta"))
+            if int(meta.get("schema_version", 0)) != SCHEMA_VERSION:
+                raise ValueError(f"{path} : schéma {meta.get('schema_version')} non pris en charge")
+            self.version = meta["version"]
+            self.compiled_at = meta.get("compiled_at")
+
+            # Libellés internés : partagés entre les versions chargées dans le processus
+            self.prestations: Dict[str, Dict[str, float]] = {}
+            for domaine, prestation, heures in conn.execute("SELECT domaine, prestation, heures FROM prestations ORDER BY position"):
+                self.prestations.setdefault(sys.intern(domaine), {})[sys.intern(prestation)] = _heures(heures)
+
+            self.tarifs: Dict[str, Any] = {}
+            for section, cle, valeur in conn.execute("SELECT section, cle, valeur FROM tarifs ORDER BY rowid"):
+                cible = self.tarifs.setdefault(section, {}) if section else self.tarifs
+                if section and cle == SECTION_MARKER:
+                    continue
+                cible[sys.intern(cle)] = json.loads(valeur)
+            self.warnings = [message for (message,) in conn.execute("SELECT message FROM controles")]
+        finally:
+            conn.close()
+
+        if content_hash(self.prestations, self.tarifs) != self.version:
+            raise ValueError(f"{path} : contenu altéré (empreinte différente de la version {self.version})")
+        self.load_time = time.perf_counter() - debut
+
+
+class CatalogueStore:
+    """Instantanés d'un dossier et manifeste office -> version.
+
+    Chaque version n'est chargée qu'une fois par processus, quel que soit le nombre
+    de cabinets qui la publient.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._snapshots: Dict[str, CatalogueSnapshot] = {}
+        self._manifest: Dict[str, str] = {}
+        self._manifest_signature = None
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.directory, MANIFEST)
+
+    def offices(self) -> Dict[str, str]:
+        try:
+            stat = os.stat(self.manifest_path)
+            signature = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            return {}
+        with self._lock:
+            if signature != self._manifest_signature:
+                with open(self.manifest_path, encoding="utf-8") as f:
+                    self._manifest = json.load(f)
+                self._manifest_signature = signature
+            return dict(self._manifest)
+
+    def version(self, office: str) -> str:
+        versions = self.offices()
+        if office not in versions:
+            raise KeyError(f"Aucun catalogue publié pour le cabinet {office}")
+        return versions[office]
+
+    def snapshot(self, office: str) -> CatalogueSnapshot:
+        version = self.version(office)
+        with self._lock:
+            if version not in self._snapshots:
+                self._snapshots[version] = CatalogueSnapshot(os.path.join(self.directory, f"{version}.sqlite3"))
+            return self._snapshots[version]
+
+    def publish(self, office: str, version: str) -> None:
+        """Associe le cabinet à une version compilée (remplacement atomique du manifeste)."""
+        if not os.path.exists(os.path.join(self.directory, f"{version}.sqlite3")):
+            raise FileNotFoundError(f"Version {version} absente de {self.directory}")
+        versions = self.offices()
+        versions[office] = version
+        temporaire = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(temporaire, "w", encoding="utf-8") as f:
+            json.dump(versions, f, ensure_ascii=False, indent=2, sort_keys=True)
+        os.replace(temporaire, self.manifest_path)
+
+
+def _load_function(path: str, nom: str):
+    spec = importlib.util.spec_from_file_location(os.path.splitext(os.path.basename(path))[0].replace("-", "_"), path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return getattr(module, nom)()
+
+
+def main():
+    base = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Compilation et publication des catalogues de prestations.")
+    parser.add_argument("commande", choices=("check", "build", "list"))
+    parser.add_argument("--store", default=os.getenv("CATALOGUE_STORE", ".catalogue"))
+    parser.add_argument("--office", default=os.getenv("CATALOGUE_OFFICE", "default"))
+    parser.add_argument("--prestations", default=os.path.join(base, "prestations-heures.py"))
+    parser.add_argument("--tarifs", default=os.path.join(base, "tarifs-prestations.py"))
+    parser.add_argument("--strict", action="store_true", help="Refuser les forfaits sans prestation correspondante")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+
+    if args.commande == "list":
+        store = CatalogueStore(args.store)
+        for office, version in sorted(store.offices().items()):
+            print(f"{office:20} {version}")
+        return
+
+    prestations = _load_function(args.prestations, "get_prestations")
+    tarifs = _load_function(args.tarifs, "get_tarifs")
+    if args.commande == "check":
+        erreurs, avertissements = validate_catalogue(prestations, tarifs, args.strict)
+        for avertissement in avertissements:
+            print(f"avertissement : {avertissement}")
+        for erreur in erreurs:
+            print(f"erreur : {erreur}")
+        sys.exit(1 if erreurs else 0)
+
+    try:
+        version = compile_catalogue(prestations, tarifs, args.store, args.strict)
+    except CatalogueValidationError as e:
+        print(e)
+        sys.exit(1)
+    CatalogueStore(args.store).publish(args.office, version)
+    print(f"Catalogue {version} publié pour le cabinet {args.office} dans {args.store}")
+
+
+if __name__ == "__main__":
+    main()
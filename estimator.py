@@ -0,0 +1,972 @@
+import openai
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, OpenAI
+import httpx
+import os
+import re
+import sys
+import importlib.util
+import json
+import logging
+import math
+import threading
+import time
+from typing import Tuple, Dict, Any, List, Iterator
+import response_cache
+import catalogue_store
+from catalogue_index import CatalogueIndex
+from pricing import PricingTable
+from metrics import metrics
+import transport
+import structured_logging
+from structured_logging import Lazy, redacting
+
+# Configuration du logging : enregistrements JSON écrits par un thread dédié,
+# échantillonnage par niveau (LOG_SAMPLING="DEBUG=0.1,INFO=0.5")
+structured_logging.configure_logging(
+    level=os.getenv("LOG_LEVEL", "INFO"),
+    sampling=structured_logging.parse_sampling(os.getenv("LOG_SAMPLING", "")),
+)
+logger = logging.getLogger(__name__)
+
+# Export des métriques dans un fichier JSONL à rotation ; l'endpoint METRICS_PORT est
+# démarré par les points d'entrée (metrics.start_http_server_from_env), jamais à l'import
+if os.getenv("METRICS_JSONL_PATH"):
+    metrics.enable_jsonl(os.getenv("METRICS_JSONL_PATH"))
+
+# Configuration du client OpenAI, créé une seule fois par processus : son pool de
+# connexions HTTP est partagé par toutes les sessions Streamlit. Les reprises sont
+# gérées par le transport ci-dessous plutôt que par le client.
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "50"))
+client = OpenAI(
+    api_key=os.getenv('OPENAI_API_KEY'),
+    max_retries=0,
+    http_client=transport.pooled_http_client(max_connections=OPENAI_MAX_CONNECTIONS)
+)
+MODEL_NAME = "gpt-3.5-turbo"
+
+# Budget total d'une estimation (secondes), réparti entre les étapes, et transport résilient :
+# reprises espacées aléatoirement, requête doublée pour la classification si
+# HEDGE_CLASSIFICATION_DELAY est défini, disjoncteur basculant sur une estimation
+# établie à partir du seul catalogue lorsque l'API est indisponible.
+ESTIMATE_DEADLINE = float(os.getenv("ESTIMATE_DEADLINE", "30"))
+HEDGE_CLASSIFICATION_DELAY = float(os.getenv("HEDGE_CLASSIFICATION_DELAY", "0")) or None
+# Quota du compte OpenAI partagé par tout le processus (0 : pas de limite côté client).
+# Les demandes urgentes puis celles des sociétés passent en priorité ; une demande qui
+# ne pourrait pas être servie dans son délai reçoit aussitôt l'estimation du catalogue.
+OPENAI_RPM = float(os.getenv("OPENAI_RPM", "0"))
+OPENAI_TPM = float(os.getenv("OPENAI_TPM", "0"))
+scheduler = transport.RateLimitScheduler(
+    requests_per_minute=OPENAI_RPM,
+    tokens_per_minute=OPENAI_TPM,
+    max_queue=int(os.getenv("SCHEDULER_MAX_QUEUE", "200")),
+) if OPENAI_RPM or OPENAI_TPM else None
+resilient = transport.ResilientTransport(
+    max_retries=int(os.getenv("OPENAI_MAX_RETRIES", "2")),
+    default_deadline=ESTIMATE_DEADLINE,
+    hedge_delay=HEDGE_CLASSIFICATION_DELAY,
+    breaker=transport.CircuitBreaker(
+        failure_threshold=int(os.getenv("CIRCUIT_BREAKER_THRESHOLD", "5")),
+        recovery_time=float(os.getenv("CIRCUIT_BREAKER_RECOVERY", "30")),
+    ),
+    scheduler=scheduler,
+)
+metrics.register_collector("circuit_breaker", lambda: {"open": int(resilient.breaker.state != "closed")})
+if scheduler is not None:
+    metrics.register_collector("scheduler_depth", scheduler.depth)
+
+# Questions identiques (même clé de cache) soumises simultanément : un seul appel au
+# modèle, dont le résultat est partagé par tous les appelants en attente
+coalescer = transport.SingleFlight()
+metrics.register_collector("singleflight", lambda: {"in_flight": coalescer.in_flight()})
+
+# Erreurs pour lesquelles l'estimation se poursuit en mode dégradé
+API_ERRORS = (openai.OpenAIError, transport.TransportError)
+
+# Mode d'estimation : "structured" (un seul appel avec sortie structurée),
+# "two_calls" (analyze_question puis get_detailed_analysis), conservé pour comparer
+# latence et coût en tokens entre les deux approches, ou "streaming" (estimation
+# affichée dès la classification, analyse détaillée transmise au fil de l'eau).
+ESTIMATION_MODE = os.getenv("ESTIMATION_MODE", "structured")
+
+def load_py_module(file_path, module_name):
+    try:
+        spec = importlib.util.spec_from_file_location(module_name, file_path)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[module_name] = module
+        spec.loader.exec_module(module)
+        return module
+    except Exception as e:
+        logger.error("Erreur lors du chargement du module %s : %s", module_name, e)
+        return None
+
+# Chemins des modules à charger, relatifs au dépôt pour permettre l'import depuis
+# d'autres points d'entrée (application Streamlit, traitement par lots)
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+prestations_path = os.path.join(BASE_DIR, 'prestations-heures.py')
+tarifs_path = os.path.join(BASE_DIR, 'tarifs-prestations.py')
+instructions_path = os.path.join(BASE_DIR, 'chatbot-instructions.py')
+synonymes_path = os.path.join(BASE_DIR, 'synonymes-prestations.py')
+
+# Seuil choisi sur classification_eval.jsonl : aucune erreur au-dessus de 0,9
+# (evaluate_classification.py rapporte exactitude et couverture au seuil courant)
+LOCAL_CLASSIFICATION_THRESHOLD = float(os.getenv("LOCAL_CLASSIFICATION_THRESHOLD", "0.9"))
+# Nombre de prestations présélectionnées localement envoyées au modèle pour la
+# classification ; 0 envoie le catalogue complet dans le prompt système
+CLASSIFICATION_TOP_K = int(os.getenv("CLASSIFICATION_TOP_K", "0"))
+# Cascade de modèles pour la classification, du moins cher au plus fiable : la réponse
+# d'un modèle est retenue si elle figure au catalogue avec une probabilité (logprobs)
+# d'au moins CASCADE_MIN_CONFIDENCE, sinon le modèle suivant est interrogé.
+CLASSIFICATION_MODELS = [m.strip() for m in os.getenv("CLASSIFICATION_MODELS", MODEL_NAME).split(",") if m.strip()]
+if not CLASSIFICATION_MODELS:
+    logger.warning("CLASSIFICATION_MODELS vide : classification par %s", MODEL_NAME)
+    CLASSIFICATION_MODELS = [MODEL_NAME]
+CASCADE_MIN_CONFIDENCE = float(os.getenv("CASCADE_MIN_CONFIDENCE", "0.7"))
+# Intervalle minimal entre deux vérifications des dates de modification des fichiers
+CATALOGUE_CHECK_INTERVAL = float(os.getenv("CATALOGUE_CHECK_INTERVAL", "1"))
+
+CATALOGUE_FILES = (
+    (prestations_path, 'prestations_heures'),
+    (tarifs_path, 'tarifs_prestations'),
+    (instructions_path, 'consignes_chatbot'),
+    (synonymes_path, 'synonymes_prestations'),
+)
+
+# Catalogues compilés (python catalogue_store.py build) : avec CATALOGUE_STORE, les
+# prestations et tarifs de chaque cabinet sont lus dans l'instantané publié pour lui,
+# et seuls les instructions et synonymes restent chargés depuis les fichiers Python.
+CATALOGUE_STORE = os.getenv("CATALOGUE_STORE")
+CATALOGUE_OFFICE = os.getenv("CATALOGUE_OFFICE", "default")
+store = catalogue_store.CatalogueStore(CATALOGUE_STORE) if CATALOGUE_STORE else None
+if store is not None and CATALOGUE_OFFICE not in store.offices():
+    raise catalogue_store.CatalogueConfigurationError(
+        f"Aucun catalogue publié pour le cabinet {CATALOGUE_OFFICE} (CATALOGUE_OFFICE) dans {CATALOGUE_STORE} (CATALOGUE_STORE) : "
+        f"python catalogue_store.py build --store {CATALOGUE_STORE} --office {CATALOGUE_OFFICE}"
+    )
+
+
+def _format_options(entrees):
+    options = {}
+    for domaine, prestation in entrees:
+        options.setdefault(domaine, []).append(prestation)
+    return '\n'.join(f"{domaine}: {', '.join(prestations_domaine)}" for domaine, prestations_domaine in options.items())
+
+
+def _system_prompt(instructions, options_str=None):
+    # Partie statique du prompt, placée en tête pour former un préfixe stable
+    # d'un appel à l'autre (mise en cache du prompt côté API)
+    prompt = f"""{instructions}
+
+En tant qu'assistant juridique de View Avocats, vous analysez les questions des clients et identifiez le domaine juridique et la prestation la plus pertinente parmi les options données."""
+    if options_str:
+        prompt += f"""
+
+
+Options de domaines et prestations :
+{options_str}"""
+    return prompt
+
+
+def _source_files():
+    if store is None:
+        return CATALOGUE_FILES
+    return tuple(f for f in CATALOGUE_FILES if f[0] not in (prestations_path, tarifs_path))
+
+
+def _files_signature(office):
+    signature = [store.version(office)] if store is not None else []
+    for path, _ in _source_files():
+        try:
+            stat = os.stat(path)
+            signature.append((path, stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            signature.append((path, None, None))
+    return tuple(signature)
+
+
+def _content_hash(office):
+    empreinte = response_cache.file_fingerprint([path for path, _ in _source_files()])
+    return f"{store.version(office)}-{empreinte}" if store is not None else empreinte
+
+
+class Catalogue:
+    """Prestations, tarifs, instructions et structures dérivées, chargés ensemble.
+
+    Une instance est partagée par toutes les sessions du processus, et par tous les
+    cabinets publiant la même version ; get_catalogue() la remplace lorsque l'un des
+    fichiers sources est modifié ou qu'une nouvelle version est publiée.
+    """
+
+    def __init__(self, office=CATALOGUE_OFFICE):
+        self.office = office
+        self.signature = _files_signature(office)
+        self.load_times = {}
+        modules = {}
+        for path, module_name in _source_files():
+            debut = time.perf_counter()
+            modules[path] = load_py_module(path, module_name)
+            self.load_times[os.path.basename(path)] = time.perf_counter() - debut
+        instructions_module, synonymes_module = modules[instructions_path], modules[synonymes_path]
+
+        debut = time.perf_counter()
+        if store is not None:
+            snapshot = store.snapshot(office)
+            self.load_times["snapshot"] = snapshot.load_time
+            self.prestations, self.tarifs = snapshot.prestations, snapshot.tarifs
+        else:
+            prestations_module, tarifs_module = modules[prestations_path], modules[tarifs_path]
+            self.prestations = prestations_module.get_prestations() if prestations_module else {}
+            self.tarifs = tarifs_module.get_tarifs() if tarifs_module else {}
+        self.instructions = instructions_module.get_chatbot_instructions() if instructions_module else ""
+        synonymes = synonymes_module.get_synonymes() if synonymes_module else {}
+        self.load_times["materialisation"] = time.perf_counter() - debut
+
+        # Prompt système construit une fois par version du catalogue
+        self.system_prompt = _system_prompt(self.instructions, _format_options((d, p) for d, ps in self.prestations.items() for p in ps))
+
+        # Classifieur local : les questions contenant un libellé évident du catalogue sont
+        # classées sans appel réseau lorsque la confiance dépasse le seuil.
+        debut = time.perf_counter()
+        self.catalogue_index = CatalogueIndex(self.prestations, synonymes)
+        self.load_times["catalogue_index"] = time.perf_counter() - debut
+
+        # Table des estimations précalculée pour chaque (domaine, prestation, urgence)
+        debut = time.perf_counter()
+        self.pricing_table = PricingTable(self.prestations, self.tarifs)
+        self.load_times["pricing_table"] = time.perf_counter() - debut
+
+        # L'empreinte des fichiers lus par le modèle fait partie des clés du cache des réponses :
+        # toute modification du catalogue ou des instructions invalide les entrées.
+        if store is not None:
+            self.hash = f"{store.version(office)}-{response_cache.file_fingerprint([instructions_path])}"
+        else:
+            self.hash = response_cache.file_fingerprint([prestations_path, tarifs_path, instructions_path])
+        self.content_hash = _content_hash(office)
+        self.checked_at = time.monotonic()
+        metrics.observe("module_load", sum(self.load_times.values()))
+        logger.info("Catalogue chargé (%s) : %s", self.content_hash, Lazy(lambda: ", ".join(f"{k}={v * 1000:.1f}ms" for k, v in self.load_times.items())))
+
+
+_catalogue_lock = threading.Lock()
+_catalogues = {CATALOGUE_OFFICE: Catalogue()}
+
+
+def get_catalogue(office=None) -> Catalogue:
+    """Catalogue courant du cabinet, rechargé si l'un des fichiers sources a changé."""
+    office = office or CATALOGUE_OFFICE
+    if store is None and office != CATALOGUE_OFFICE:
+        # Sans catalogues compilés, seul le cabinet configuré existe
+        raise KeyError(f"Aucun catalogue publié pour le cabinet {office}")
+    courant = _catalogues.get(office)
+    if courant is not None and time.monotonic() - courant.checked_at < CATALOGUE_CHECK_INTERVAL:
+        return courant
+    signature = _files_signature(office)
+    if courant is not None:
+        courant.checked_at = time.monotonic()
+        if signature == courant.signature:
+            return courant
+    with _catalogue_lock:
+        courant = _catalogues.get(office)
+        if courant is None or courant.signature != signature:
+            partage = next((c for c in _catalogues.values() if c.signature == signature), None)
+            if partage is not None:
+                # Même version déjà chargée pour un autre cabinet
+                _catalogues[office] = partage
+            elif courant is not None and _content_hash(office) == courant.content_hash:
+                # Date modifiée sans changement de contenu
+                courant.signature = signature
+            else:
+                _catalogues[office] = Catalogue(office)
+    return _catalogues[office]
+
+
+# Cache persistant des réponses du modèle
+RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH", ".cache/reponses.sqlite3")
+if RESPONSE_CACHE_PATH:
+    reponses_cache = response_cache.ResponseCache(
+        RESPONSE_CACHE_PATH,
+        max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "5000")),
+        ttl_seconds=float(os.getenv("RESPONSE_CACHE_TTL", str(7 * 24 * 3600))),
+    )
+else:
+    reponses_cache = response_cache.NullCache()
+metrics.register_collector("response_cache", reponses_cache.stats)
+
+
+def _cache_key(etape, question, client_type, urgency, *extra):
+    return response_cache.make_key(etape, question, client_type, urgency, MODEL_NAME, get_catalogue().hash, *extra)
+
+
+def classify_locally(question):
+    domaine, prestation, confiance = get_catalogue().catalogue_index.classify(question)
+    if domaine and confiance >= LOCAL_CLASSIFICATION_THRESHOLD:
+        logger.info("Classification locale : %s, %s (confiance %s)", domaine, prestation, confiance)
+        metrics.increment("local_classifications")
+        return domaine, prestation
+    return None
+
+
+def _request_prompt(question, client_type, urgency, consigne, options_str=None):
+    # Partie propre à chaque demande, placée en fin de prompt
+    prompt = f"""Question : {question}
+Type de client : {client_type}
+Degré d'urgence : {urgency}"""
+    if options_str:
+        prompt += f"""
+
+
+Options de domaines et prestations :
+{options_str}"""
+    return f"{prompt}\n\n\n{consigne}"
+
+
+def _classification_messages(question, client_type, urgency):
+    courant = get_catalogue()
+    candidats = courant.catalogue_index.rank(question, k=CLASSIFICATION_TOP_K) if CLASSIFICATION_TOP_K else []
+    consigne = "Répondez avec le domaine et la prestation la plus pertinente, séparés par une virgule."
+    if candidats:
+        # Mode budget de tokens : seules les prestations présélectionnées localement sont envoyées
+        return [
+            {"role": "system", "content": _system_prompt(courant.instructions)},
+            {"role": "user", "content": _request_prompt(question, client_type, urgency, consigne, _format_options((d, p) for d, p, _ in candidats))}
+        ]
+    return [
+        {"role": "system", "content": courant.system_prompt},
+        {"role": "user", "content": _request_prompt(question, client_type, urgency, consigne)}
+    ]
+
+
+def _parse_classification(answer):
+    answer = answer.strip()
+    parts = answer.split(',')
+    if len(parts) >= 2:
+        return parts[0].strip(), parts[1].strip()
+    else:
+        return answer, "prestation générale"
+
+
+def _lane(client_type, urgency):
+    if urgency == "Urgent":
+        return transport.LANE_URGENT
+    if client_type == "Société":
+        return transport.LANE_SOCIETE
+    return transport.LANE_STANDARD
+
+
+def catalogue_only_classification(question):
+    """Meilleure prestation selon l'index local, quel que soit son score de confiance."""
+    metrics.increment("degraded", stage="classification")
+    domaine, prestation, _ = get_catalogue().catalogue_index.classify(question)
+    if domaine:
+        return domaine, prestation
+    return "services_généraux", "consultation"
+
+
+@metrics.timed("analyze_question")
+@redacting
+def analyze_question(question, client_type, urgency):
+    classification_locale = classify_locally(question)
+    if classification_locale:
+        return classification_locale
+
+    cle = _cache_key("analyze_question", question, client_type, urgency, CLASSIFICATION_TOP_K, CLASSIFICATION_MODELS, CASCADE_MIN_CONFIDENCE)
+    en_cache = reponses_cache.get(cle)
+    if en_cache is not None:
+        return tuple(en_cache)
+
+    try:
+        return coalescer.do(cle, "classification", lambda: _remote_classification(cle, question, client_type, urgency))
+    except API_ERRORS as e:
+        logger.warning("Classification indisponible, repli sur le catalogue : %s", e)
+        return catalogue_only_classification(question)
+
+
+def _remote_classification(cle, question, client_type, urgency):
+    debut = time.perf_counter()
+    messages = _classification_messages(question, client_type, urgency)
+    cascade = len(CLASSIFICATION_MODELS) > 1
+    for rang, modele in enumerate(CLASSIFICATION_MODELS):
+        dernier = rang == len(CLASSIFICATION_MODELS) - 1
+        try:
+            palier = classify_with_model(modele, question, client_type, urgency, messages, logprobs=cascade)
+        except API_ERRORS as e:
+            # Modèle indisponible ou inconnu : le palier suivant est interrogé
+            if dernier:
+                raise
+            metrics.increment("cascade_escalations", model=modele, reason="error")
+            logger.warning("Classification par %s en échec (%s), passage au modèle suivant", modele, e)
+            continue
+        if dernier or cascade_accepts(palier, CASCADE_MIN_CONFIDENCE):
+            break
+        raison = "off_catalogue" if palier["catalogue_entry"] is None else "low_confidence"
+        metrics.increment("cascade_escalations", model=modele, reason=raison)
+        logger.info("Classification de %s écartée (%s, confiance %s), passage au modèle suivant", modele, raison, palier["confidence"])
+    metrics.increment("cascade_answers", model=modele)
+
+    # Libellés canoniques du catalogue lorsque la réponse y figure
+    resultat = palier["catalogue_entry"] or (palier["domaine"], palier["prestation"])
+    reponses_cache.set(cle, resultat, time.perf_counter() - debut)
+    return resultat
+
+
+def classify_with_model(model, question, client_type, urgency, messages=None, logprobs=True) -> Dict[str, Any]:
+    """Un palier de la cascade : réponse du modèle, entrée correspondante du catalogue et confiance."""
+    debut = time.perf_counter()
+    response = resilient.create(
+        client,
+        "classification",
+        hedge=True,
+        priority=_lane(client_type, urgency),
+        model=model,
+        messages=messages or _classification_messages(question, client_type, urgency),
+        **({"logprobs": True} if logprobs else {})
+    )
+    return _classification_tier(model, response, debut)
+
+
+def _classification_tier(model, response, debut) -> Dict[str, Any]:
+    cout = _log_usage("Classification", response, debut, model)
+    domaine, prestation = _parse_classification(response.choices[0].message.content)
+    return {
+        "model": model,
+        "domaine": domaine,
+        "prestation": prestation,
+        "catalogue_entry": get_catalogue().pricing_table.resolve(domaine, prestation),
+        "confidence": _answer_confidence(response),
+        "seconds": time.perf_counter() - debut,
+        "cost_usd": cout,
+    }
+
+
+def _answer_confidence(response):
+    """Probabilité de la réponse complète d'après les logprobs, None s'ils sont absents."""
+    logprobs = getattr(response.choices[0], "logprobs", None)
+    jetons = getattr(logprobs, "content", None)
+    if not jetons:
+        return None
+    return math.exp(sum(jeton.logprob for jeton in jetons))
+
+
+def cascade_accepts(palier: Dict[str, Any], min_confidence: float) -> bool:
+    if palier["catalogue_entry"] is None:
+        return False
+    return palier["confidence"] is None or palier["confidence"] >= min_confidence
+
+
+@metrics.timed("calculate_estimate")
+def calculate_estimate(domaine, prestation, urgency, office=None):
+    courant = get_catalogue(office)
+    try:
+        return courant.pricing_table.quote(domaine, prestation, urgency)
+    except Exception as e:
+        logger.error("Erreur dans calculate_estimate pour %s / %s : %s", domaine, prestation, e)
+        logger.debug("tarifs : %s ; prestations : %s", courant.tarifs, courant.prestations)
+        raise
+
+
+
+def _detailed_analysis_messages(question: str, client_type: str, urgency: str, domaine: str, prestation: str) -> List[Dict[str, str]]:
+    prompt = f"""
+    En tant qu'assistant juridique expert, analysez la question suivante et expliquez votre raisonnement pour le choix du domaine juridique et de la prestation.
+    
+    Question : {question}
+    Type de client : {client_type}
+    Degré d'urgence : {urgency}
+    Domaine recommandé : {domaine}
+    Prestation recommandée : {prestation}
+
+    Structurez votre réponse en trois parties distinctes :
+    1. Analyse détaillée : Expliquez votre raisonnement de manière claire et concise.
+    2. Éléments spécifiques utilisés : Fournissez un objet JSON valide et strict, avec des guillemets doubles pour toutes les clés et les valeurs string. 
+       Exemple : {{"domaine": {{"nom": "Droit_du_travail", "description": "Encadre les relations entre employeurs et salariés"}}, "prestation": {{"nom": "Contestation_licenciement", "description": "Assistance juridique pour contester un licenciement"}}}}
+    3. Sources d'information : Listez les sources spécifiques utilisées (fichiers de tarifs, de prestations, ou autres sources internes).
+
+    Assurez-vous que chaque partie est clairement séparée et que le JSON est correctement formaté.
+    """
+    return [
+        {"role": "system", "content": "Vous êtes un assistant juridique expert qui explique son raisonnement de manière détaillée et transparente."},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def _parse_elements(elements_str: str) -> Dict[str, Any]:
+    logger.debug("Partie des éléments spécifiques : %s", elements_str)
+    elements_used = {}
+    # Tentative d'extraction du JSON
+    json_match = re.search(r'(\{.*?\})', elements_str, re.DOTALL)
+    if json_match:
+        try:
+            elements_used = json.loads(json_match.group(1))
+            logger.info("JSON extrait avec succès")
+        except json.JSONDecodeError as e:
+            logger.error("Erreur lors du parsing JSON : %s", e)
+
+    # Si l'extraction du JSON a échoué, on extrait les informations manuellement
+    if not elements_used:
+        logger.info("Extraction manuelle des informations")
+        metrics.increment("parse_fallbacks", stage="elements_json")
+        domaine_match = re.search(r'domaine .*? est le (.*?),', elements_str)
+        prestation_match = re.search(r'prestation recommandée est (.*?)\.|$', elements_str)
+
+        elements_used = {
+            "domaine": {"nom": domaine_match.group(1) if domaine_match else "Non spécifié"},
+            "prestation": {"nom": prestation_match.group(1) if prestation_match else "Non spécifiée"}
+        }
+    return elements_used
+
+
+@metrics.timed("get_detailed_analysis")
+@redacting
+def get_detailed_analysis(question: str, client_type: str, urgency: str, domaine: str, prestation: str) -> Tuple[str, Dict[str, Any], str]:
+    cle = _cache_key("get_detailed_analysis", question, client_type, urgency, domaine, prestation)
+    en_cache = reponses_cache.get(cle)
+    if en_cache is not None:
+        logger.info("Analyse détaillée servie depuis le cache")
+        return tuple(en_cache)
+
+    try:
+        return coalescer.do(cle, "detailed_analysis", lambda: _remote_detailed_analysis(cle, question, client_type, urgency, domaine, prestation))
+    except API_ERRORS as e:
+        logger.warning("Analyse détaillée indisponible, repli sur le catalogue : %s", e)
+        return catalogue_only_analysis(domaine, prestation)
+    except Exception as e:
+        logger.exception("Erreur lors de l'appel à l'API ou du traitement de la réponse : %s", e)
+        return _analysis_error(e)
+
+
+def _remote_detailed_analysis(cle, question, client_type, urgency, domaine, prestation):
+    logger.info("Envoi de la requête à l'API OpenAI")
+    debut = time.perf_counter()
+    response = resilient.create(
+        client,
+        "detailed_analysis",
+        priority=_lane(client_type, urgency),
+        model=MODEL_NAME,
+        messages=_detailed_analysis_messages(question, client_type, urgency, domaine, prestation),
+        temperature=0.5,
+        max_tokens=1000
+    )
+
+    _log_usage("Analyse détaillée", response, debut)
+    resultat = _parse_detailed_response(response.choices[0].message.content)
+    reponses_cache.set(cle, resultat, time.perf_counter() - debut)
+    return resultat
+
+
+def _parse_detailed_response(full_response: str) -> Tuple[str, Dict[str, Any], str]:
+    logger.debug("Réponse complète de l'API : %s", full_response)
+    # Même découpage que le streaming : les deux modes partagent l'entrée du cache
+    decoupage = SectionSplitter()
+    decoupage.feed(full_response)
+    decoupage.close()
+    resultat = _split_sections(decoupage)
+    logger.info("Analyse terminée avec succès")
+    return resultat
+
+
+def _split_sections(decoupage: "SectionSplitter") -> Tuple[str, Dict[str, Any], str]:
+    analysis, elements_str, sources = (partie.strip() for partie in decoupage.sections)
+    if elements_str or sources:
+        return (analysis or "Analyse non disponible.", _parse_elements(elements_str) if elements_str else {},
+                sources or "Aucune source spécifique mentionnée.")
+
+    # Sections sur une même ligne ("1. … 2. … 3. …") : découpage sur les numéros
+    parts = re.split(r'\d+\.|\*\*', decoupage.texte.strip())
+    parts = [part.strip() for part in parts if part.strip()]
+    logger.debug("Parties séparées de la réponse : %s", parts)
+
+    analysis = parts[0] if parts else "Analyse non disponible."
+    elements_used = _parse_elements(parts[1]) if len(parts) > 1 else {}
+    sources = parts[2] if len(parts) > 2 else "Aucune source spécifique mentionnée."
+    return analysis, elements_used, sources
+
+
+def catalogue_only_analysis(domaine: str, prestation: str) -> Tuple[str, Dict[str, Any], str]:
+    metrics.increment("degraded", stage="detailed_analysis")
+    analysis = (
+        "L'analyse détaillée n'est pas disponible pour le moment. L'estimation ci-dessus "
+        f"a été établie à partir de notre catalogue pour la prestation « {prestation.replace('_', ' ')} » "
+        f"en {domaine.replace('_', ' ')}. Un avocat du cabinet pourra affiner cette analyse lors de la consultation."
+    )
+    elements_used = {"domaine": {"nom": domaine}, "prestation": {"nom": prestation}}
+    return analysis, elements_used, "Catalogue des prestations et grille tarifaire de View Avocats."
+
+
+def _analysis_error(e: Exception) -> Tuple[str, Dict[str, Any], str]:
+    return "Une erreur s'est produite lors de l'analyse.", {"error": "Erreur lors de l'analyse", "details": str(e)}, "Non disponible en raison d'une erreur."
+
+
+class SectionSplitter:
+    """Découpe la réponse en trois sections (analyse, éléments, sources) au fil des fragments reçus.
+
+    Une ligne n'est retenue que tant qu'elle peut encore devenir un marqueur de section
+    ("2.", "**3.", "### 2)"...) ; tout le reste est transmis immédiatement.
+    """
+
+    MARQUEUR = re.compile(r'^\s*(?:#+\s*)?(?:\*\*)?\s*([1-3])\s*[.)]\s*(?:\*\*)?\s*')
+    DEBUT_MARQUEUR = re.compile(r'^\s*(?:#+\s*)?(?:\*{1,2})?\s*\d?\s*$')
+    TITRE = re.compile(r"^(?:analyse détaillée|éléments spécifiques utilisés|sources d'information)\s*(?:\*\*)?\s*:?\s*(?:\*\*)?\s*", re.IGNORECASE)
+
+    def __init__(self):
+        self.section = 0
+        self.sections = ["", "", ""]
+        self.texte = ""
+        self._ligne = ""
+        self._ligne_engagee = False
+        self._marqueur_vu = False
+
+    def feed(self, fragment: str) -> List[Tuple[int, str]]:
+        evenements = []
+        self.texte += fragment
+        self._ligne += fragment
+        while "\n" in self._ligne:
+            ligne, self._ligne = self._ligne.split("\n", 1)
+            evenements.extend(self._traiter(ligne + "\n"))
+            self._ligne_engagee = False
+        if self._ligne and (self._ligne_engagee or not self._peut_etre_marqueur(self._ligne)):
+            evenements.extend(self._traiter(self._ligne))
+            self._ligne = ""
+        return evenements
+
+    def _peut_etre_marqueur(self, ligne: str) -> bool:
+        # Un titre de section est conservé jusqu'à la fin de sa ligne pour en retirer le libellé
+        return bool(self.DEBUT_MARQUEUR.match(ligne)) or self._nouvelle_section(ligne) is not None
+
+    def _nouvelle_section(self, texte: str):
+        marqueur = self.MARQUEUR.match(texte)
+        if marqueur:
+            section = int(marqueur.group(1)) - 1
+            if section > self.section or (section == 0 and not self._marqueur_vu):
+                return section, marqueur
+        return None
+
+    def close(self) -> List[Tuple[int, str]]:
+        evenements = self._traiter(self._ligne) if self._ligne else []
+        self._ligne = ""
+        return evenements
+
+    def _traiter(self, texte: str) -> List[Tuple[int, str]]:
+        if not self._ligne_engagee:
+            nouvelle_section = self._nouvelle_section(texte)
+            if nouvelle_section:
+                self.section, marqueur = nouvelle_section
+                self._marqueur_vu = True
+                texte = self.TITRE.sub("", texte[marqueur.end():]).lstrip("\n")
+        self._ligne_engagee = True
+        if not texte:
+            return []
+        self.sections[self.section] += texte
+        return [(self.section, texte)]
+
+
+class DetailedAnalysisStream:
+    """Itère sur le texte de l'analyse détaillée au fur et à mesure de sa génération.
+
+    Destiné à st.write_stream ; une fois l'itération terminée, analysis,
+    elements_used et sources contiennent le résultat complet.
+    """
+
+    def __init__(self, question: str, client_type: str, urgency: str, domaine: str, prestation: str):
+        self.arguments = (question, client_type, urgency, domaine, prestation)
+        self.analysis = "Analyse non disponible."
+        self.elements_used: Dict[str, Any] = {}
+        self.sources = "Aucune source spécifique mentionnée."
+
+    def __iter__(self) -> Iterator[str]:
+        question, client_type, urgency, domaine, prestation = self.arguments
+        cle = _cache_key("get_detailed_analysis", *self.arguments)
+        en_cache = reponses_cache.get(cle)
+        if en_cache is not None:
+            logger.info("Analyse détaillée servie depuis le cache")
+            self.analysis, self.elements_used, self.sources = en_cache
+            yield self.analysis
+            return
+
+        try:
+            debut = time.perf_counter()
+            flux = resilient.create(
+                client,
+                "detailed_analysis",
+                priority=_lane(client_type, urgency),
+                model=MODEL_NAME,
+                messages=_detailed_analysis_messages(question, client_type, urgency, domaine, prestation),
+                temperature=0.5,
+                max_tokens=1000,
+                stream=True,
+                stream_options={"include_usage": True}
+            )
+            decoupage = SectionSplitter()
+            premier_fragment = None
+            for chunk in flux:
+                if chunk.usage:
+                    _log_usage("Analyse détaillée (streaming)", chunk, debut)
+                if not chunk.choices or not chunk.choices[0].delta.content:
+                    continue
+                if premier_fragment is None:
+                    premier_fragment = time.perf_counter() - debut
+                    metrics.observe("detailed_analysis_first_token", premier_fragment)
+                    logger.info("Premier fragment de l'analyse reçu après %.2fs", premier_fragment)
+                for section, texte in decoupage.feed(chunk.choices[0].delta.content):
+                    if section == 0:
+                        yield texte
+            for section, texte in decoupage.close():
+                if section == 0:
+                    yield texte
+
+            # Même découpage que sans streaming : les deux modes partagent l'entrée du cache
+            self.analysis, self.elements_used, self.sources = _split_sections(decoupage)
+            reponses_cache.set(cle, (self.analysis, self.elements_used, self.sources), time.perf_counter() - debut)
+            metrics.observe("get_detailed_analysis", time.perf_counter() - debut)
+        except API_ERRORS as e:
+            with structured_logging.redact(question):
+                logger.warning("Analyse détaillée indisponible, repli sur le catalogue : %s", e)
+            self.analysis, self.elements_used, self.sources = catalogue_only_analysis(domaine, prestation)
+            yield self.analysis
+        except Exception as e:
+            with structured_logging.redact(question):
+                logger.exception("Erreur lors de l'appel à l'API ou du traitement de la réponse : %s", e)
+            self.analysis, self.elements_used, self.sources = _analysis_error(e)
+            yield self.analysis
+
+
+def _log_usage(etape: str, response, debut: float, model: str = MODEL_NAME) -> float:
+    usage = getattr(response, "usage", None)
+    details = getattr(usage, "prompt_tokens_details", None)
+    prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+    completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+    cached_tokens = getattr(details, "cached_tokens", 0) or 0
+    cout = metrics.record_usage(getattr(response, "model", None) or model, etape, prompt_tokens, completion_tokens, cached_tokens)
+    logger.info(
+        "%s : %.2fs, tokens prompt=%d (dont %d en cache) completion=%d",
+        etape, time.perf_counter() - debut, prompt_tokens, cached_tokens, completion_tokens
+    )
+    return cout
+
+
+def _estimation_tool() -> Dict[str, Any]:
+    prestations = get_catalogue().prestations
+    toutes_prestations = sorted({p for prestations_domaine in prestations.values() for p in prestations_domaine})
+    return {
+        "type": "function",
+        "function": {
+            "name": "enregistrer_estimation",
+            "description": "Enregistre le domaine juridique, la prestation retenue et l'analyse détaillée de la demande.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "domaine": {"type": "string", "enum": list(prestations.keys())},
+                    "prestation": {"type": "string", "enum": toutes_prestations},
+                    "analysis": {"type": "string", "description": "Analyse détaillée expliquant le raisonnement de manière claire et concise."},
+                    "elements_used": {
+                        "type": "object",
+                        "description": "Éléments spécifiques utilisés, par exemple {\"domaine\": {\"nom\": ..., \"description\": ...}, \"prestation\": {\"nom\": ..., \"description\": ...}}",
+                    },
+                    "sources": {"type": "string", "description": "Sources spécifiques utilisées (fichiers de tarifs, de prestations, ou autres sources internes)."}
+                },
+                "required": ["domaine", "prestation", "analysis", "elements_used", "sources"]
+            }
+        }
+    }
+
+
+def _validate_classification(domaine: str, prestation: str) -> Tuple[str, str]:
+    prestations = get_catalogue().prestations
+    if prestation in prestations.get(domaine, {}):
+        return domaine, prestation
+    # Le modèle peut associer une prestation valide au mauvais domaine
+    for autre_domaine, prestations_domaine in prestations.items():
+        if prestation in prestations_domaine:
+            logger.warning("Domaine corrigé : %s -> %s pour la prestation %s", domaine, autre_domaine, prestation)
+            return autre_domaine, prestation
+    raise ValueError(f"Prestation hors catalogue : {domaine}, {prestation}")
+
+
+def _structured_messages(question: str, client_type: str, urgency: str) -> List[Dict[str, str]]:
+    consigne = "Expliquez votre raisonnement, puis enregistrez votre réponse avec la fonction enregistrer_estimation."
+    return [
+        {"role": "system", "content": get_catalogue().system_prompt},
+        {"role": "user", "content": _request_prompt(question, client_type, urgency, consigne)}
+    ]
+
+
+def _structured_request(question: str, client_type: str, urgency: str) -> Dict[str, Any]:
+    return dict(
+        model=MODEL_NAME,
+        messages=_structured_messages(question, client_type, urgency),
+        tools=[_estimation_tool()],
+        tool_choice={"type": "function", "function": {"name": "enregistrer_estimation"}},
+        temperature=0.5,
+        max_tokens=1000
+    )
+
+
+def _parse_structured(response) -> Tuple[str, str, str, Dict[str, Any], str]:
+    arguments = json.loads(response.choices[0].message.tool_calls[0].function.arguments)
+    domaine, prestation = _validate_classification(arguments.get("domaine", ""), arguments.get("prestation", ""))
+    analysis = arguments.get("analysis") or "Analyse non disponible."
+    elements_used = arguments.get("elements_used") or {}
+    sources = arguments.get("sources") or "Aucune source spécifique mentionnée."
+    return domaine, prestation, analysis, elements_used, sources
+
+
+@metrics.timed("get_structured_estimate")
+@redacting
+def get_structured_estimate(question: str, client_type: str, urgency: str) -> Tuple[str, str, str, Dict[str, Any], str]:
+    cle = _cache_key("get_structured_estimate", question, client_type, urgency)
+    en_cache = reponses_cache.get(cle)
+    if en_cache is not None:
+        logger.info("Estimation structurée servie depuis le cache")
+        return tuple(en_cache)
+
+    return coalescer.do(cle, "structured", lambda: _remote_structured_estimate(cle, question, client_type, urgency))
+
+
+def _remote_structured_estimate(cle, question, client_type, urgency):
+    debut = time.perf_counter()
+    response = resilient.create(client, "structured", priority=_lane(client_type, urgency), **_structured_request(question, client_type, urgency))
+    _log_usage("Estimation structurée", response, debut)
+
+    resultat = _parse_structured(response)
+    reponses_cache.set(cle, resultat, time.perf_counter() - debut)
+    return resultat
+
+
+@metrics.timed("estimate")
+@redacting
+def estimate_question(question: str, client_type: str, urgency: str) -> Tuple[str, str, str, Dict[str, Any], str]:
+    debut = time.perf_counter()
+    with transport.deadline(ESTIMATE_DEADLINE):
+        # Une classification locale sûre rend l'appel structuré inutile : seule
+        # l'analyse détaillée nécessite encore le modèle.
+        if ESTIMATION_MODE == "structured" and not classify_locally(question):
+            try:
+                resultat = get_structured_estimate(question, client_type, urgency)
+                logger.info("Mode structured : %.2fs au total", time.perf_counter() - debut)
+                logger.debug("Cache des réponses : %s", Lazy(reponses_cache.stats))
+                return resultat
+            except transport.AdmissionRejected as e:
+                # Quota saturé : inutile de tenter les deux appels séparés
+                logger.warning("Estimation structurée refusée (%s), estimation à partir du catalogue", e)
+                domaine, prestation = catalogue_only_classification(question)
+                return (domaine, prestation, *catalogue_only_analysis(domaine, prestation))
+            except API_ERRORS as e:
+                logger.warning("Estimation structurée indisponible, repli sur le mode two_calls : %s", e)
+            except Exception as e:
+                logger.warning("Échec de l'estimation structurée, repli sur le mode two_calls : %s", e)
+                metrics.increment("parse_fallbacks", stage="structured")
+
+        domaine, prestation = analyze_question(question, client_type, urgency)
+        detailed_analysis, elements_used, sources = get_detailed_analysis(question, client_type, urgency, domaine, prestation)
+    logger.info("Mode two_calls : %.2fs au total", time.perf_counter() - debut)
+    logger.debug("Cache des réponses : %s", Lazy(reponses_cache.stats))
+    return domaine, prestation, detailed_analysis, elements_used, sources
+
+
+# Variantes asynchrones du pipeline, utilisées par le traitement par lots (batch.py).
+# Elles partagent les prompts, l'analyse des réponses et le cache avec les versions synchrones.
+_async_client = None
+
+
+def get_async_client() -> AsyncOpenAI:
+    global _async_client
+    if _async_client is None:
+        _async_client = AsyncOpenAI(
+            api_key=os.getenv('OPENAI_API_KEY'),
+            timeout=ESTIMATE_DEADLINE,
+            http_client=DefaultAsyncHttpxClient(limits=httpx.Limits(max_connections=OPENAI_MAX_CONNECTIONS, max_keepalive_connections=OPENAI_MAX_CONNECTIONS))
+        )
+    return _async_client
+
+
+@metrics.timed("analyze_question")
+@redacting
+async def async_analyze_question(question: str, client_type: str, urgency: str) -> Tuple[str, str]:
+    classification_locale = classify_locally(question)
+    if classification_locale:
+        return classification_locale
+
+    cle = _cache_key("analyze_question", question, client_type, urgency, CLASSIFICATION_TOP_K, CLASSIFICATION_MODELS, CASCADE_MIN_CONFIDENCE)
+    en_cache = reponses_cache.get(cle)
+    if en_cache is not None:
+        return tuple(en_cache)
+
+    debut = time.perf_counter()
+    messages = _classification_messages(question, client_type, urgency)
+    cascade = len(CLASSIFICATION_MODELS) > 1
+    for rang, modele in enumerate(CLASSIFICATION_MODELS):
+        dernier = rang == len(CLASSIFICATION_MODELS) - 1
+        debut_palier = time.perf_counter()
+        try:
+            response = await get_async_client().chat.completions.create(
+                model=modele,
+                messages=messages,
+                **({"logprobs": True} if cascade else {})
+            )
+        except API_ERRORS as e:
+            if dernier:
+                raise
+            metrics.increment("cascade_escalations", model=modele, reason="error")
+            logger.warning("Classification par %s en échec (%s), passage au modèle suivant", modele, e)
+            continue
+        palier = _classification_tier(modele, response, debut_palier)
+        if dernier or cascade_accepts(palier, CASCADE_MIN_CONFIDENCE):
+            break
+        metrics.increment("cascade_escalations", model=modele, reason="off_catalogue" if palier["catalogue_entry"] is None else "low_confidence")
+    metrics.increment("cascade_answers", model=modele)
+
+    resultat = palier["catalogue_entry"] or (palier["domaine"], palier["prestation"])
+    reponses_cache.set(cle, resultat, time.perf_counter() - debut)
+    return resultat
+
+
+@metrics.timed("get_detailed_analysis")
+@redacting
+async def async_get_detailed_analysis(question: str, client_type: str, urgency: str, domaine: str, prestation: str) -> Tuple[str, Dict[str, Any], str]:
+    cle = _cache_key("get_detailed_analysis", question, client_type, urgency, domaine, prestation)
+    en_cache = reponses_cache.get(cle)
+    if en_cache is not None:
+        return tuple(en_cache)
+
+    # Pas de repli ici : une erreur remonte à l'appelant (batch.py), qui retentera la ligne
+    debut = time.perf_counter()
+    response = await get_async_client().chat.completions.create(
+        model=MODEL_NAME,
+        messages=_detailed_analysis_messages(question, client_type, urgency, domaine, prestation),
+        temperature=0.5,
+        max_tokens=1000
+    )
+    _log_usage("Analyse détaillée", response, debut)
+    resultat = _parse_detailed_response(response.choices[0].message.content)
+    reponses_cache.set(cle, resultat, time.perf_counter() - debut)
+    return resultat
+
+
+@metrics.timed("get_structured_estimate")
+@redacting
+async def async_get_structured_estimate(question: str, client_type: str, urgency: str) -> Tuple[str, str, str, Dict[str, Any], str]:
+    cle = _cache_key("get_structured_estimate", question, client_type, urgency)
+    en_cache = reponses_cache.get(cle)
+    if en_cache is not None:
+        return tuple(en_cache)
+
+    debut = time.perf_counter()
+    response = await get_async_client().chat.completions.create(**_structured_request(question, client_type, urgency))
+    _log_usage("Estimation structurée", response, debut)
+
+    resultat = _parse_structured(response)
+    reponses_cache.set(cle, resultat, time.perf_counter() - debut)
+    return resultat
+
+
+@metrics.timed("estimate")
+@redacting
+async def async_estimate_question(question: str, client_type: str, urgency: str) -> Tuple[str, str, str, Dict[str, Any], str]:
+    if ESTIMATION_MODE == "structured" and not classify_locally(question):
+        try:
+            return await async_get_structured_estimate(question, client_type, urgency)
+        except Exception as e:
+            logger.warning("Échec de l'estimation structurée, repli sur le mode two_calls : %s", e)
+            metrics.increment("parse_fallbacks", stage="structured")
+
+    domaine, prestation = await async_analyze_question(question, client_type, urgency)
+    detailed_analysis, elements_used, sources = await async_get_detailed_analysis(question, client_type, urgency, domaine, prestation)
+    return domaine, prestation, detailed_analysis, elements_used, sources
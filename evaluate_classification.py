@@ -0,0 +1,156 @@
+"""Évaluation hors ligne de la classification, palier par palier.
+
+Chaque question étiquetée (colonnes question, client_type, urgency, domaine et
+prestation attendus) est classée par l'index local puis par chacun des modèles, sans
+passer par le cache. Le rapport donne pour chaque palier l'exactitude, la part de
+réponses hors catalogue, les quantiles de latence et le coût. La cascade est ensuite
+simulée pour plusieurs seuils de confiance à partir des mêmes réponses.
+
+    python evaluate_classification.py classification_eval.jsonl --models gpt-4o-mini gpt-4o --thresholds 0.5 0.7 0.9
+    python evaluate_classification.py classification_eval.jsonl --fake   # faux client de bench.py
+"""
+import argparse
+import csv
+import json
+import logging
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+import estimator
+from metrics import percentile
+
+
+def load_labeled(path: str) -> List[Dict[str, str]]:
+    with open(path, encoding="utf-8", newline="") as f:
+        lignes = [json.loads(l) for l in f if l.strip()] if path.endswith(".jsonl") else list(csv.DictReader(f))
+    return [{
+        "question": l["question"],
+        "client_type": l.get("client_type") or "Particulier",
+        "urgency": l.get("urgency") or "Normal",
+        "attendu": (l["domaine"], l["prestation"]),
+    } for l in lignes]
+
+
+def _correct(palier: Dict[str, Any], attendu) -> bool:
+    return (palier["catalogue_entry"] or (palier["domaine"], palier["prestation"])) == attendu
+
+
+def evaluate_question(ligne: Dict[str, Any], models: List[str]) -> Dict[str, Any]:
+    question, client_type, urgency = ligne["question"], ligne["client_type"], ligne["urgency"]
+    domaine, prestation, confiance = estimator.get_catalogue().catalogue_index.classify(question)
+    paliers = []
+    for modele in models:
+        try:
+            paliers.append(estimator.classify_with_model(modele, question, client_type, urgency))
+        except estimator.API_ERRORS as e:
+            paliers.append({"model": modele, "error": str(e)})
+    return {**ligne, "local": {"entree": (domaine, prestation) if domaine else None, "confidence": confiance}, "paliers": paliers}
+
+
+def tier_report(resultats: List[Dict[str, Any]], rang: int) -> Dict[str, Any]:
+    paliers = [(r["paliers"][rang], r["attendu"]) for r in resultats]
+    valides = [(p, a) for p, a in paliers if "error" not in p]
+    latences = [p["seconds"] for p, _ in valides]
+    couts = [p["cost_usd"] for p, _ in valides]
+    return {
+        "model": paliers[0][0]["model"],
+        "accuracy": sum(_correct(p, a) for p, a in valides) / len(valides) if valides else 0.0,
+        "off_catalogue_rate": sum(p["catalogue_entry"] is None for p, _ in valides) / len(valides) if valides else 0.0,
+        "errors": len(paliers) - len(valides),
+        "p50_s": percentile(latences, 0.5),
+        "p95_s": percentile(latences, 0.95),
+        "mean_cost_usd": sum(couts) / len(couts) if couts else 0.0,
+        "total_cost_usd": sum(couts),
+    }
+
+
+def local_report(resultats: List[Dict[str, Any]], threshold: float) -> Dict[str, Any]:
+    retenues = [r for r in resultats if r["local"]["entree"] and r["local"]["confidence"] >= threshold]
+    return {
+        "accuracy": sum(r["local"]["entree"] == r["attendu"] for r in resultats) / len(resultats),
+        "threshold": threshold,
+        "coverage": len(retenues) / len(resultats),
+        "accuracy_above_threshold": sum(r["local"]["entree"] == r["attendu"] for r in retenues) / len(retenues) if retenues else 0.0,
+    }
+
+
+def simulate_cascade(resultats: List[Dict[str, Any]], threshold: float) -> Dict[str, Any]:
+    """Rejoue la cascade avec les réponses enregistrées de chaque palier."""
+    correctes, latences, couts = 0, [], []
+    repondu_par: Dict[str, int] = {}
+    for r in resultats:
+        latence = cout = 0.0
+        palier = None
+        for rang, candidat in enumerate(r["paliers"]):
+            if "error" in candidat:
+                continue
+            palier = candidat
+            latence += candidat["seconds"]
+            cout += candidat["cost_usd"]
+            if rang == len(r["paliers"]) - 1 or estimator.cascade_accepts(candidat, threshold):
+                break
+        if palier is None:
+            continue
+        repondu_par[palier["model"]] = repondu_par.get(palier["model"], 0) + 1
+        correctes += _correct(palier, r["attendu"])
+        latences.append(latence)
+        couts.append(cout)
+    return {
+        "threshold": threshold,
+        "accuracy": correctes / len(latences) if latences else 0.0,
+        "answered_by": repondu_par,
+        "p50_s": percentile(latences, 0.5),
+        "p95_s": percentile(latences, 0.95),
+        "mean_cost_usd": sum(couts) / len(couts) if couts else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Évaluation hors ligne de la cascade de classification.")
+    parser.add_argument("labeled", help="Fichier CSV ou JSONL de questions étiquetées")
+    parser.add_argument("--models", nargs="+", default=estimator.CLASSIFICATION_MODELS)
+    parser.add_argument("--thresholds", nargs="+", type=float, default=[estimator.CASCADE_MIN_CONFIDENCE])
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--output", metavar="FICHIER", help="Rapport JSON détaillé")
+    parser.add_argument("--fake", action="store_true", help="Utiliser le faux client de bench.py (sans appel réseau)")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    if args.fake:
+        import bench
+        with open("bench_fixtures.json", encoding="utf-8") as f:
+            fixtures = json.load(f)
+        estimator.client = bench.FakeOpenAI(bench.FakeCompletions(fixtures, bench.DEFAULT_LATENCY, scale=0.01))
+
+    questions = load_labeled(args.labeled)
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        resultats = list(executor.map(lambda ligne: evaluate_question(ligne, args.models), questions))
+
+    rapport = {
+        "questions": len(resultats),
+        "local": local_report(resultats, estimator.LOCAL_CLASSIFICATION_THRESHOLD),
+        "tiers": [tier_report(resultats, rang) for rang in range(len(args.models))],
+        "cascade": [simulate_cascade(resultats, seuil) for seuil in args.thresholds],
+    }
+
+    local = rapport["local"]
+    print(f"{'local':24} exactitude {local['accuracy']:6.1%}  couverture au seuil {local['threshold']} {local['coverage']:6.1%} "
+          f"(exactitude {local['accuracy_above_threshold']:6.1%})")
+    for palier in rapport["tiers"]:
+        print(f"{palier['model']:24} exactitude {palier['accuracy']:6.1%}  hors catalogue {palier['off_catalogue_rate']:6.1%}  "
+              f"p50 {palier['p50_s'] * 1000:8.1f}ms  p95 {palier['p95_s'] * 1000:8.1f}ms  "
+              f"{palier['mean_cost_usd'] * 1000:.4f} $/1000 questions  erreurs {palier['errors']}")
+    for simulation in rapport["cascade"]:
+        print(f"cascade seuil {simulation['threshold']:<10} exactitude {simulation['accuracy']:6.1%}  "
+              f"p50 {simulation['p50_s'] * 1000:8.1f}ms  p95 {simulation['p95_s'] * 1000:8.1f}ms  "
+              f"{simulation['mean_cost_usd'] * 1000:.4f} $/1000 questions  réponses {simulation['answered_by']}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({**rapport, "details": resultats}, f, ensure_ascii=False, indent=2, default=list)
+        print(f"Rapport enregistré dans {args.output}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,258 @@
+import functools
+import inspect
+import json
+import logging
+import logging.handlers
+import math
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Prix en dollars par million de tokens (entrée, sortie), surchargeables par MODEL_PRICES_JSON
+MODEL_PRICES = {
+    "gpt-3.5-turbo": (0.50, 1.50),
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+}
+MODEL_PRICES.update({k: tuple(v) for k, v in json.loads(os.getenv("MODEL_PRICES_JSON", "{}")).items()})
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(**labels: Any) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(valeur: str) -> str:
+    # Échappements du format texte Prometheus
+    return valeur.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+def _price(model: str) -> Tuple[float, float]:
+    if model in MODEL_PRICES:
+        return MODEL_PRICES[model]
+    # Les réponses de l'API renvoient des noms datés (gpt-4o-mini-2024-07-18)
+    for nom in sorted(MODEL_PRICES, key=len, reverse=True):
+        if model.startswith(nom):
+            return MODEL_PRICES[nom]
+    return 0.0, 0.0
+
+
+def percentile(valeurs, q: float) -> float:
+    if not valeurs:
+        return 0.0
+    ordonnees = sorted(valeurs)
+    # Rang le plus proche
+    return ordonnees[min(len(ordonnees) - 1, max(0, math.ceil(q * len(ordonnees)) - 1))]
+
+
+class Metrics:
+    """Mesures du processus : latences par étape, compteurs, tokens et coût par modèle.
+
+    Les latences sont conservées sur une fenêtre glissante pour le calcul des
+    quantiles ; les nombres et sommes d'observations sont cumulés depuis le démarrage.
+    """
+
+    def __init__(self, window: int = 2048):
+        self._lock = threading.Lock()
+        self._window = window
+        self._samples: Dict[str, deque] = {}
+        self._counts: Dict[str, int] = defaultdict(int)
+        self._sums: Dict[str, float] = defaultdict(float)
+        self._counters: Dict[Tuple[str, Labels], float] = defaultdict(float)
+        self._collectors: Dict[str, Callable[[], Dict[str, float]]] = {}
+        self._event_logger: Optional[logging.Logger] = None
+
+    def observe(self, stage: str, seconds: float, **fields: Any) -> None:
+        with self._lock:
+            if stage not in self._samples:
+                self._samples[stage] = deque(maxlen=self._window)
+            self._samples[stage].append(seconds)
+            self._counts[stage] += 1
+            self._sums[stage] += seconds
+        self._emit({"type": "latency", "stage": stage, "seconds": round(seconds, 6), **fields})
+
+    @contextmanager
+    def timer(self, stage: str, **fields: Any):
+        debut = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - debut, **fields)
+
+    def timed(self, stage: str):
+        """Décorateur mesurant la durée d'une fonction, synchrone ou asynchrone."""
+        def decorateur(fonction):
+            if inspect.iscoroutinefunction(fonction):
+                @functools.wraps(fonction)
+                async def enveloppe_async(*args, **kwargs):
+                    with self.timer(stage):
+                        return await fonction(*args, **kwargs)
+                return enveloppe_async
+
+            @functools.wraps(fonction)
+            def enveloppe(*args, **kwargs):
+                with self.timer(stage):
+                    return fonction(*args, **kwargs)
+            return enveloppe
+        return decorateur
+
+    def increment(self, name: str, value: float = 1, **labels: Any) -> None:
+        with self._lock:
+            self._counters[(name, _labels(**labels))] += value
+        self._emit({"type": "counter", "name": name, "value": value, **labels})
+
+    def accumulate(self, name: str, value: float = 1, **labels: Any) -> None:
+        """Compteur sans événement JSONL, pour les chemins appelés à chaque log."""
+        with self._lock:
+            self._counters[(name, _labels(**labels))] += value
+
+    def record_usage(self, model: str, stage: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> float:
+        prix_entree, prix_sortie = _price(model)
+        cout = (prompt_tokens * prix_entree + completion_tokens * prix_sortie) / 1_000_000
+        labels = _labels(model=model, stage=stage)
+        with self._lock:
+            self._counters[("model_calls", labels)] += 1
+            self._counters[("prompt_tokens", labels)] += prompt_tokens
+            self._counters[("completion_tokens", labels)] += completion_tokens
+            self._counters[("cached_tokens", labels)] += cached_tokens
+            self._counters[("cost_usd", labels)] += cout
+        self._emit({
+            "type": "usage", "model": model, "stage": stage, "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens, "cached_tokens": cached_tokens, "cost_usd": round(cout, 8),
+        })
+        return cout
+
+    def register_collector(self, name: str, collector: Callable[[], Dict[str, float]]) -> None:
+        """Jauges calculées à la demande, par exemple les statistiques du cache."""
+        self._collectors[name] = collector
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            echantillons = {stage: list(valeurs) for stage, valeurs in self._samples.items()}
+            counts, sums = dict(self._counts), dict(self._sums)
+        return {
+            stage: {
+                "count": counts[stage],
+                "mean": sums[stage] / counts[stage] if counts[stage] else 0.0,
+                **{f"p{int(q * 100)}": percentile(valeurs, q) for q in QUANTILES},
+            }
+            for stage, valeurs in echantillons.items()
+        }
+
+    def counters(self) -> Dict[str, float]:
+        with self._lock:
+            return {name + _format_labels(labels): valeur for (name, labels), valeur in self._counters.items()}
+
+    def render_prometheus(self) -> str:
+        lignes = ["# TYPE estimator_stage_latency_seconds summary"]
+        with self._lock:
+            echantillons = {stage: list(valeurs) for stage, valeurs in self._samples.items()}
+            counts, sums = dict(self._counts), dict(self._sums)
+            compteurs = dict(self._counters)
+        for stage, valeurs in sorted(echantillons.items()):
+            for q in QUANTILES:
+                lignes.append(f'estimator_stage_latency_seconds{{stage="{stage}",quantile="{q}"}} {percentile(valeurs, q):.6f}')
+            lignes.append(f'estimator_stage_latency_seconds_sum{{stage="{stage}"}} {sums[stage]:.6f}')
+            lignes.append(f'estimator_stage_latency_seconds_count{{stage="{stage}"}} {counts[stage]}')
+        noms_declares = set()
+        for (name, labels), valeur in sorted(compteurs.items()):
+            if name not in noms_declares:
+                lignes.append(f"# TYPE estimator_{name}_total counter")
+                noms_declares.add(name)
+            lignes.append(f"estimator_{name}_total{_format_labels(labels)} {valeur:g}")
+        for collecteur, fonction in sorted(self._collectors.items()):
+            try:
+                jauges = fonction()
+            except Exception as e:
+                logger.warning(f"Collecteur de métriques {collecteur} en échec : {e}")
+                continue
+            for nom, valeur in sorted(jauges.items()):
+                if isinstance(valeur, (int, float)):
+                    lignes.append(f"# TYPE estimator_{collecteur}_{nom} gauge")
+                    lignes.append(f"estimator_{collecteur}_{nom} {valeur:g}")
+        return "\n".join(lignes) + "\n"
+
+    def enable_jsonl(self, path: str, max_bytes: int = 10 * 1024 * 1024, backup_count: int = 5) -> None:
+        """Écrit chaque mesure dans un fichier JSONL à rotation."""
+        dossier = os.path.dirname(path)
+        if dossier:
+            os.makedirs(dossier, exist_ok=True)
+        event_logger = logging.getLogger("estimator.metrics.events")
+        event_logger.propagate = False
+        event_logger.setLevel(logging.INFO)
+        if not event_logger.handlers:
+            handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            event_logger.addHandler(handler)
+        self._event_logger = event_logger
+
+    def _emit(self, evenement: Dict[str, Any]) -> None:
+        if self._event_logger is not None:
+            self._event_logger.info(json.dumps({"ts": round(time.time(), 3), **evenement}, ensure_ascii=False))
+
+
+metrics = Metrics()
+
+_server_lock = threading.Lock()
+_server: Optional[ThreadingHTTPServer] = None
+
+
+def start_http_server(port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """Sert /metrics (format texte Prometheus) et /metrics.json ; un seul serveur par processus."""
+    global _server
+    with _server_lock:
+        if _server is not None:
+            return _server
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.startswith("/metrics.json"):
+                    corps = json.dumps({"latency": metrics.summary(), "counters": metrics.counters()}, ensure_ascii=False).encode("utf-8")
+                    type_contenu = "application/json"
+                elif self.path.startswith("/metrics"):
+                    corps = metrics.render_prometheus().encode("utf-8")
+                    type_contenu = "text/plain; version=0.0.4; charset=utf-8"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", type_contenu)
+                self.send_header("Content-Length", str(len(corps)))
+                self.end_headers()
+                self.wfile.write(corps)
+
+            def log_message(self, format, *args):
+                pass
+
+        _server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+        logger.info(f"Métriques exposées sur http://{host}:{port}/metrics")
+        return _server
+
+
+def start_http_server_from_env() -> Optional[ThreadingHTTPServer]:
+    """Endpoint séparé sur METRICS_PORT pour l'application Streamlit et le traitement
+    par lots ; l'API expose ses mesures sur sa propre route /metrics."""
+    port = os.getenv("METRICS_PORT")
+    if not port:
+        return None
+    try:
+        return start_http_server(int(port))
+    except OSError as e:
+        logger.warning("Port des métriques %s indisponible : %s", port, e)
+        return None
@@ -0,0 +1,163 @@
+import logging
+import math
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from catalogue_index import fold
+
+logger = logging.getLogger(__name__)
+
+URGENCES = ("Normal", "Urgent")
+HEURES_PAR_DEFAUT = 10
+
+Quote = Tuple[int, int, List[str], Dict[str, Any]]
+
+
+def _alias(libelle: str) -> str:
+    return fold(libelle).replace(" ", "_")
+
+
+def compute_quote(heures: float, prestation: str, urgency: str, tarifs: Dict[str, Any]) -> Quote:
+    """Calcul de référence d'une estimation, détaillé étape par étape."""
+    tarif_horaire = tarifs.get("tarif_horaire_standard")
+    if tarif_horaire is None:
+        raise KeyError("tarif_horaire_standard non trouvé dans tarifs")
+
+    estimation = heures * tarif_horaire
+
+
+    calcul_details = [f"Heures estimées: {heures}"]
+    calcul_details.append(f"Tarif horaire standard: {tarif_horaire} €")
+    calcul_details.append(f"Estimation initiale: {heures} x {tarif_horaire} = {estimation} €")
+
+
+    if urgency == "Urgent":
+        facteur_urgence = tarifs.get("facteur_urgence", 1.5)
+        estimation *= facteur_urgence
+        calcul_details.append(f"Facteur d'urgence appliqué: x{facteur_urgence}")
+        calcul_details.append(f"Estimation après urgence: {estimation} €")
+
+
+    forfait = tarifs.get("forfaits", {}).get(prestation)
+    if forfait:
+        calcul_details.append(f"Forfait disponible pour cette prestation: {forfait} €")
+        if forfait < estimation:
+            estimation = forfait
+            calcul_details.append(f"Forfait appliqué car plus avantageux: {forfait} €")
+        else:
+            calcul_details.append("Forfait non appliqué car moins avantageux que l'estimation horaire")
+
+
+    estimation_basse = round(estimation * 0.8)
+    estimation_haute = round(estimation * 1.2)
+    calcul_details.append(f"Fourchette d'estimation: {estimation_basse} € - {estimation_haute} €")
+
+
+    tarifs_utilises = {
+        "tarif_horaire_standard": tarif_horaire,
+        "facteur_urgence": tarifs.get("facteur_urgence") if urgency == "Urgent" else "Non appliqué",
+        "forfait_prestation": forfait if forfait else "Pas de forfait pour cette prestation"
+    }
+    return estimation_basse, estimation_haute, calcul_details, tarifs_utilises
+
+
+def merge_tarifs(actuels: Dict[str, Any], proposes: Dict[str, Any]) -> Dict[str, Any]:
+    """Tarifs actuels modifiés par une proposition : les dictionnaires imbriqués
+    (forfaits, frais_additionnels) sont fusionnés clé par clé."""
+    fusion = dict(actuels)
+    for cle, valeur in proposes.items():
+        if isinstance(valeur, dict) and isinstance(fusion.get(cle), dict):
+            fusion[cle] = {**fusion[cle], **valeur}
+        else:
+            fusion[cle] = valeur
+    return fusion
+
+
+class PricingTable:
+    """Estimations précalculées pour chaque (domaine, prestation, urgence) du catalogue.
+
+    Les libellés renvoyés par le modèle sont résolus par un index d'alias normalisés
+    (casse, accents, espaces et apostrophes ignorés) avant la recherche dans la table.
+    """
+
+    def __init__(self, prestations: Dict[str, Dict[str, float]], tarifs: Dict[str, Any]):
+        self.prestations = prestations
+        self.tarifs = tarifs
+        self.entrees: List[Tuple[str, str]] = [(d, p) for d, ps in prestations.items() for p in ps]
+        self._positions = {entree: i for i, entree in enumerate(self.entrees)}
+
+        self.quotes: Dict[Tuple[str, str, str], Quote] = {}
+        if tarifs.get("tarif_horaire_standard") is not None:
+            for domaine, prestation in self.entrees:
+                for urgency in URGENCES:
+                    self.quotes[(domaine, prestation, urgency)] = compute_quote(prestations[domaine][prestation], prestation, urgency, tarifs)
+
+        # Alias : "domaine|prestation" puis prestation seule lorsqu'elle est unique dans le catalogue
+        self.alias: Dict[str, Tuple[str, str]] = {}
+        doublons = set()
+        for domaine, prestation in self.entrees:
+            self.alias[f"{_alias(domaine)}|{_alias(prestation)}"] = (domaine, prestation)
+            cle = _alias(prestation)
+            if cle in self.alias:
+                doublons.add(cle)
+            self.alias[cle] = (domaine, prestation)
+        for cle in doublons:
+            del self.alias[cle]
+
+        self.heures = np.array([prestations[d][p] for d, p in self.entrees], dtype=float)
+
+    def resolve(self, domaine: str, prestation: str) -> Optional[Tuple[str, str]]:
+        if (domaine, prestation) in self._positions:
+            return domaine, prestation
+        return self.alias.get(f"{_alias(domaine)}|{_alias(prestation)}") or self.alias.get(_alias(prestation))
+
+    def quote(self, domaine: str, prestation: str, urgency: str) -> Quote:
+        entree = self.resolve(domaine, prestation)
+        if entree is None:
+            logger.warning("Prestation hors catalogue : %s, %s ; estimation sur %s heures", domaine, prestation, HEURES_PAR_DEFAUT)
+            return compute_quote(HEURES_PAR_DEFAUT, prestation, urgency, self.tarifs)
+        if not self.quotes:
+            raise KeyError("tarif_horaire_standard non trouvé dans tarifs")
+        cle = (*entree, "Urgent" if urgency == "Urgent" else "Normal")
+        estimation_basse, estimation_haute, calcul_details, tarifs_utilises = self.quotes[cle]
+        # Copies : l'appelant ne doit pas pouvoir modifier la table
+        return estimation_basse, estimation_haute, list(calcul_details), dict(tarifs_utilises)
+
+    def reprice(self, tarifs: Optional[Dict[str, Any]] = None, quotes: Optional[Iterable[Tuple[str, str, str]]] = None) -> Dict[str, np.ndarray]:
+        """Ré-estime en une passe vectorisée le catalogue entier (par défaut) ou une liste
+        de (domaine, prestation, urgence), sous les tarifs actuels ou une proposition de
+        tarifs (dictionnaire au format de get_tarifs(), fusionné avec les tarifs actuels)."""
+        proposes = merge_tarifs(self.tarifs, tarifs or {})
+        tarif_horaire = proposes.get("tarif_horaire_standard")
+        if tarif_horaire is None:
+            raise KeyError("tarif_horaire_standard non trouvé dans tarifs")
+        facteur_urgence = proposes.get("facteur_urgence", 1.5)
+        forfaits = proposes.get("forfaits", {})
+
+        if quotes is None:
+            quotes = [(d, p, u) for d, p in self.entrees for u in URGENCES]
+        else:
+            quotes = list(quotes)
+
+        heures = np.empty(len(quotes), dtype=float)
+        forfait = np.empty(len(quotes), dtype=float)
+        urgent = np.empty(len(quotes), dtype=bool)
+        for i, (domaine, prestation, urgency) in enumerate(quotes):
+            entree = self.resolve(domaine, prestation)
+            libelle = entree[1] if entree else prestation
+            heures[i] = self.heures[self._positions[entree]] if entree else HEURES_PAR_DEFAUT
+            forfait[i] = forfaits.get(libelle) or math.nan
+            urgent[i] = urgency == "Urgent"
+
+        estimation = heures * tarif_horaire
+        estimation = np.where(urgent, estimation * facteur_urgence, estimation)
+        estimation = np.where(forfait < estimation, forfait, estimation)
+        return {
+            "domaine": np.array([q[0] for q in quotes], dtype=object),
+            "prestation": np.array([q[1] for q in quotes], dtype=object),
+            "urgency": np.array([q[2] for q in quotes], dtype=object),
+            "estimation": estimation,
+            "estimation_basse": np.round(estimation * 0.8).astype(int),
+            "estimation_haute": np.round(estimation * 1.2).astype(int),
+        }
@@ -0,0 +1,134 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Any, Dict, Iterable, Optional
+
+
+def normalize_question(question: str) -> str:
+    """Forme canonique d'une question : casse, espaces et ponctuation finale ignorés."""
+    texte = unicodedata.normalize("NFC", question or "").casefold()
+    texte = re.sub(r"\s+", " ", texte).strip()
+    return texte.rstrip(" ?!.…")
+
+
+def file_fingerprint(paths: Iterable[str]) -> str:
+    """Empreinte du contenu des fichiers de catalogue et d'instructions."""
+    empreinte = hashlib.sha256()
+    for path in paths:
+        empreinte.update(os.path.basename(path).encode("utf-8"))
+        try:
+            with open(path, "rb") as f:
+                empreinte.update(f.read())
+        except OSError:
+            empreinte.update(b"<absent>")
+    return empreinte.hexdigest()[:16]
+
+
+def make_key(stage: str, question: str, client_type: str, urgency: str, model: str, catalogue_hash: str, *extra: Any) -> str:
+    composants = [stage, normalize_question(question), client_type, urgency, model, catalogue_hash]
+    composants.extend(str(e) for e in extra)
+    return hashlib.sha256("\x1f".join(composants).encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Cache SQLite des réponses du modèle, borné en nombre d'entrées (LRU) et en durée (TTL)."""
+
+    def __init__(self, path: str, max_entries: int = 5000, ttl_seconds: float = 7 * 24 * 3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expired": 0, "saved_seconds": 0.0}
+
+        dossier = os.path.dirname(path)
+        if dossier:
+            os.makedirs(dossier, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS reponses (
+                cle TEXT PRIMARY KEY,
+                valeur TEXT NOT NULL,
+                cree_le REAL NOT NULL,
+                dernier_acces REAL NOT NULL,
+                duree_calcul REAL NOT NULL DEFAULT 0
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_reponses_acces ON reponses(dernier_acces)")
+
+    def get(self, key: str) -> Optional[Any]:
+        maintenant = time.time()
+        with self._lock:
+            ligne = self._conn.execute(
+                "SELECT valeur, cree_le, duree_calcul FROM reponses WHERE cle = ?", (key,)
+            ).fetchone()
+            if ligne is None:
+                self._stats["misses"] += 1
+                return None
+            valeur, cree_le, duree_calcul = ligne
+            if self.ttl_seconds and maintenant - cree_le > self.ttl_seconds:
+                self._conn.execute("DELETE FROM reponses WHERE cle = ?", (key,))
+                self._stats["expired"] += 1
+                self._stats["misses"] += 1
+                return None
+            self._conn.execute("UPDATE reponses SET dernier_acces = ? WHERE cle = ?", (maintenant, key))
+            self._stats["hits"] += 1
+            self._stats["saved_seconds"] += duree_calcul
+        return json.loads(valeur)
+
+    def set(self, key: str, value: Any, duration: float = 0.0) -> None:
+        maintenant = time.time()
+        valeur = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO reponses (cle, valeur, cree_le, dernier_acces, duree_calcul) VALUES (?, ?, ?, ?, ?)",
+                (key, valeur, maintenant, maintenant, duration),
+            )
+            self._evict()
+
+    def _evict(self) -> None:
+        if self.ttl_seconds:
+            curseur = self._conn.execute("DELETE FROM reponses WHERE cree_le < ?", (time.time() - self.ttl_seconds,))
+            self._stats["expired"] += curseur.rowcount
+        (nombre,) = self._conn.execute("SELECT COUNT(*) FROM reponses").fetchone()
+        excedent = nombre - self.max_entries
+        if excedent > 0:
+            self._conn.execute(
+                "DELETE FROM reponses WHERE cle IN (SELECT cle FROM reponses ORDER BY dernier_acces LIMIT ?)",
+                (excedent,),
+            )
+            self._stats["evictions"] += excedent
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM reponses")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            (stats["entries"],) = self._conn.execute("SELECT COUNT(*) FROM reponses").fetchone()
+        total = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / total if total else 0.0
+        return stats
+
+
+class NullCache:
+    """Remplace ResponseCache lorsque le cache est désactivé."""
+
+    def get(self, key: str) -> Optional[Any]:
+        return None
+
+    def set(self, key: str, value: Any, duration: float = 0.0) -> None:
+        pass
+
+    def clear(self) -> None:
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {"hits": 0, "misses": 0, "evictions": 0, "expired": 0, "saved_seconds": 0.0, "entries": 0, "hit_rate": 0.0}
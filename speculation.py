@@ -0,0 +1,107 @@
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class SpeculativeJob:
+    def __init__(self, fingerprint: str):
+        self.fingerprint = fingerprint
+        self.future: Future = Future()
+        self.timer: Optional[threading.Timer] = None
+        self.scheduled_at = time.perf_counter()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+
+class Speculator:
+    """Calculs lancés avant la demande explicite de l'utilisateur.
+
+    Un calcul programmé ne démarre qu'après debounce secondes sans nouvelle saisie ;
+    une saisie différente annule le calcul précédent. claim() renvoie le calcul en
+    cours ou terminé lorsque l'empreinte de la saisie n'a pas changé.
+    """
+
+    def __init__(self, debounce: float = 1.5, max_workers: int = 4):
+        self.debounce = debounce
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="speculation")
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        metrics.register_collector("speculation", self.stats)
+
+    def stats(self):
+        with self._lock:
+            total = self._hits + self._misses
+            return {"hits": self._hits, "misses": self._misses, "hit_rate": self._hits / total if total else 0.0}
+
+    def schedule(self, fingerprint: str, fonction: Callable[..., Any], *args: Any) -> SpeculativeJob:
+        job = SpeculativeJob(fingerprint)
+        job.timer = threading.Timer(self.debounce, self._executor.submit, args=(self._execute, job, fonction, args))
+        job.timer.daemon = True
+        job.timer.start()
+        metrics.increment("speculation_scheduled")
+        return job
+
+    def _execute(self, job: SpeculativeJob, fonction: Callable[..., Any], args) -> None:
+        if not job.future.set_running_or_notify_cancel():
+            return
+        job.started_at = time.perf_counter()
+        try:
+            resultat = fonction(*args)
+        except BaseException as e:
+            logger.warning("Calcul anticipé en échec : %s", e)
+            job.finished_at = time.perf_counter()
+            job.future.set_exception(e)
+            return
+        job.finished_at = time.perf_counter()
+        job.future.set_result(resultat)
+
+    def warm(self, fonction: Callable[..., Any], *args: Any) -> None:
+        """Tâche de préchauffage sans résultat attendu (mise en cache d'une réponse)."""
+        metrics.increment("speculation_warmups")
+        self._executor.submit(self._warm, fonction, args)
+
+    @staticmethod
+    def _warm(fonction: Callable[..., Any], args) -> None:
+        try:
+            fonction(*args)
+        except Exception as e:
+            logger.warning("Préchauffage anticipé en échec : %s", e)
+
+    def cancel(self, job: Optional[SpeculativeJob]) -> None:
+        """Abandonne un calcul devenu inutile. Un appel déjà parti vers le modèle ne
+        peut pas être interrompu : son résultat est simplement ignoré."""
+        if job is None:
+            return
+        job.timer.cancel()
+        if job.future.cancel():
+            metrics.increment("speculation_cancelled", state="pending")
+        else:
+            metrics.increment("speculation_cancelled", state="done" if job.future.done() else "running")
+
+    def claim(self, job: Optional[SpeculativeJob], fingerprint: str) -> Optional[Future]:
+        """Résultat anticipé pour cette saisie, ou None (le calcul obsolète est annulé)."""
+        if job is None or job.fingerprint != fingerprint or job.started_at is None or job.future.cancelled():
+            self.cancel(job)
+            with self._lock:
+                self._misses += 1
+            metrics.increment("speculation_misses")
+            return None
+
+        maintenant = time.perf_counter()
+        if job.future.done():
+            etat, gain = "done", job.finished_at - job.started_at
+        else:
+            etat, gain = "in_flight", maintenant - job.started_at
+        with self._lock:
+            self._hits += 1
+        metrics.increment("speculation_hits", state=etat)
+        metrics.increment("speculation_saved_seconds", gain)
+        metrics.observe("speculation_saved", gain)
+        return job.future
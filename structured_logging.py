@@ -0,0 +1,158 @@
+import atexit
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+from metrics import metrics
+
+REDACTED = "[question masquée]"
+RESERVED_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "redact"}
+
+_redacted_values: contextvars.ContextVar = contextvars.ContextVar("redacted_values", default=())
+_configure_lock = threading.Lock()
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class Lazy:
+    """Valeur calculée seulement si l'enregistrement est effectivement formaté."""
+
+    def __init__(self, fonction: Callable[[], object]):
+        self.fonction = fonction
+
+    def __str__(self) -> str:
+        return str(self.fonction())
+
+
+@contextmanager
+def redact(*valeurs: str):
+    """Masque ces textes (questions des clients) dans les journaux émis pendant le bloc."""
+    actuelles = _redacted_values.get()
+    jeton = _redacted_values.set(actuelles + tuple(v for v in valeurs if v and v not in actuelles))
+    try:
+        yield
+    finally:
+        _redacted_values.reset(jeton)
+
+
+def redacting(fonction):
+    """Décorateur : masque le premier argument (la question du client) pendant l'appel."""
+    def _question(args, kwargs):
+        return kwargs.get("question") if "question" in kwargs else (args[0] if args else None)
+
+    if inspect.iscoroutinefunction(fonction):
+        @functools.wraps(fonction)
+        async def enveloppe_async(*args, **kwargs):
+            with redact(_question(args, kwargs)):
+                return await fonction(*args, **kwargs)
+        return enveloppe_async
+
+    @functools.wraps(fonction)
+    def enveloppe(*args, **kwargs):
+        with redact(_question(args, kwargs)):
+            return fonction(*args, **kwargs)
+    return enveloppe
+
+
+class LevelSampler(logging.Filter):
+    """Ne conserve qu'une fraction des enregistrements de chaque niveau, par exemple {"DEBUG": 0.1}."""
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = {logging.getLevelName(niveau.upper()): taux for niveau, taux in rates.items()}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        taux = self.rates.get(record.levelno, 1.0)
+        if taux >= 1.0 or random.random() < taux:
+            return True
+        metrics.accumulate("log_records_sampled_out", level=record.levelname)
+        return False
+
+
+class JsonFormatter(logging.Formatter):
+    """Un objet JSON par ligne ; les champs passés par extra= sont conservés."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        message = self._masquer(record.getMessage(), record)
+        donnees = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": message,
+        }
+        for cle, valeur in record.__dict__.items():
+            if cle not in RESERVED_ATTRS and not cle.startswith("_"):
+                donnees[cle] = REDACTED if cle == "question" else valeur
+        if record.exc_info:
+            donnees["exception"] = self._masquer(self.formatException(record.exc_info), record)
+        return json.dumps(donnees, ensure_ascii=False, default=str)
+
+    @staticmethod
+    def _masquer(texte: str, record: logging.LogRecord) -> str:
+        for valeur in getattr(record, "redact", ()):
+            texte = texte.replace(valeur, REDACTED)
+        return texte
+
+
+class TimedQueueHandler(logging.handlers.QueueHandler):
+    """Dépose les enregistrements dans une file sans les formater ; le formatage
+    et l'écriture ont lieu dans le thread du QueueListener. Le temps passé ici par
+    le thread de la requête est comptabilisé dans les métriques."""
+
+    def handle(self, record: logging.LogRecord) -> bool:
+        debut = time.perf_counter()
+        try:
+            return super().handle(record)
+        finally:
+            metrics.accumulate("logging_seconds", time.perf_counter() - debut)
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Pas de getMessage() ici : les arguments sont formatés hors du thread de la requête
+        record.redact = _redacted_values.get()
+        metrics.accumulate("log_records", level=record.levelname)
+        return record
+
+
+def configure_logging(level: str = "INFO", sampling: Optional[Dict[str, float]] = None, stream=None) -> None:
+    """Remplace les handlers du logger racine par une file traitée en arrière-plan.
+
+    Sans effet si le pipeline est déjà en place dans le processus.
+    """
+    global _listener
+    with _configure_lock:
+        if _listener is not None:
+            return
+        file_attente: queue.Queue = queue.Queue(-1)
+        sortie = logging.StreamHandler(stream or sys.stderr)
+        sortie.setFormatter(JsonFormatter())
+        _listener = logging.handlers.QueueListener(file_attente, sortie, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
+
+        handler = TimedQueueHandler(file_attente)
+        if sampling:
+            handler.addFilter(LevelSampler(sampling))
+        racine = logging.getLogger()
+        for ancien in list(racine.handlers):
+            racine.removeHandler(ancien)
+        racine.addHandler(handler)
+        racine.setLevel(level.upper())
+
+
+def parse_sampling(valeur: str) -> Dict[str, float]:
+    """"DEBUG=0.1,INFO=0.5" -> {"DEBUG": 0.1, "INFO": 0.5}"""
+    taux = {}
+    for element in filter(None, (e.strip() for e in (valeur or "").split(","))):
+        niveau, _, fraction = element.partition("=")
+        taux[niveau.strip().upper()] = float(fraction)
+    return taux
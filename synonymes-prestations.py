@@ -0,0 +1,77 @@
+def get_synonymes():
+    return {
+        "services_généraux": {
+            "consultation": ["consultation", "rendez-vous avocat", "premier avis", "simple question juridique"]
+        },
+        "droit_des_affaires": {
+            "rédaction_contrats_commerciaux": ["contrat commercial", "contrat de distribution", "conditions générales de vente", "CGV", "contrat fournisseur", "contrat de prestation de services"],
+            "conseil_juridique_entreprise": ["conseil entreprise", "juriste entreprise", "conseil juridique société", "accompagnement juridique entreprise"],
+            "contentieux_commercial": ["litige commercial", "tribunal de commerce", "impayé client", "facture impayée", "recouvrement de créance", "injonction de payer"],
+            "rédaction_bail_commercial": ["rédaction bail commercial", "rédiger bail commercial", "nouveau bail commercial", "bail 3 6 9"],
+            "audit_bail_commercial": ["audit bail commercial", "relecture bail commercial", "analyse bail commercial", "renouvellement bail commercial"]
+        },
+        "droit_des_sociétés": {
+            "création_entreprise": ["création entreprise", "créer entreprise", "créer société", "création société", "immatriculation", "SAS", "SARL", "SASU", "EURL", "SCI"],
+            "fusion_acquisition": ["fusion", "acquisition", "rachat société", "cession de parts", "cession d'actions", "cession de fonds de commerce"],
+            "secrétariat_juridique_société_formalités": ["secrétariat juridique", "assemblée générale", "approbation des comptes", "formalités", "transfert de siège", "changement de gérant"],
+            "analyse_statuts": ["analyse statuts", "relecture statuts", "vérifier statuts", "pacte d'associés"],
+            "rédaction_statuts": ["rédaction statuts", "rédiger statuts", "modification statuts", "modifier statuts"]
+        },
+        "droit_propriété_intellectuelle": {
+            "propriété_intellectuelle": ["propriété intellectuelle", "marque", "dépôt de marque", "INPI", "brevet", "droit d'auteur", "contrefaçon", "nom de domaine"]
+        },
+        "droit_immobilier": {
+            "rédaction_bail_locatif": ["bail d'habitation", "bail locatif", "rédaction bail", "contrat de location", "bail meublé"],
+            "transaction_immobilière": ["transaction immobilière", "achat immobilier", "vente immobilière", "compromis de vente", "promesse de vente", "vice caché"],
+            "litige_locatif": ["litige locatif", "loyers impayés", "loyer impayé", "expulsion", "locataire", "propriétaire bailleur", "dépôt de garantie", "état des lieux"],
+            "copropriété": ["copropriété", "syndic", "assemblée de copropriétaires", "charges de copropriété", "règlement de copropriété"],
+            "construction_urbanisme": ["construction urbanisme", "construire maison", "terrain constructible"],
+            "expropriation": ["expropriation", "exproprié", "déclaration d'utilité publique", "indemnité d'expropriation"]
+        },
+        "droit_de_la_construction": {
+            "accompagnement_litige_expertise_droit_construction": ["litige construction", "expertise construction", "litige chantier", "litige avec entrepreneur"],
+            "rédaction_contrat_construction": ["contrat de construction", "contrat de construction de maison individuelle", "CCMI", "marché de travaux", "contrat d'entreprise"],
+            "litige_malfacons_simple": ["malfaçon", "malfaçons", "défaut de construction", "travaux mal faits", "garantie de parfait achèvement"],
+            "litige_malfacons_complexe": ["malfaçons graves", "garantie décennale", "assurance dommages ouvrage", "désordres structurels", "fissures"],
+            "accompagnement_réunion_expertise_judiciaire": ["réunion d'expertise", "expertise judiciaire", "expert judiciaire"],
+            "procédure_référé_construction": ["référé construction", "référé expertise", "référé chantier", "arrêt de chantier"]
+        },
+        "droit_du_travail": {
+            "rédaction_contrat_travail": ["contrat de travail", "rédaction contrat de travail", "CDI", "CDD", "clause de non-concurrence", "embauche"],
+            "licenciement": ["licenciement", "licencié", "licenciée", "licenciement abusif", "licenciement économique", "faute grave", "entretien préalable"],
+            "négociation_rupture_conventionnelle": ["rupture conventionnelle", "départ négocié", "indemnité de rupture"],
+            "contentieux_prud'hommes": ["prud'hommes", "prudhommes", "conseil de prud'hommes", "heures supplémentaires impayées", "salaire impayé", "rappel de salaire"],
+            "harcèlement_discrimination": ["harcèlement", "harcèlement moral", "harcèlement sexuel", "discrimination", "burn-out"],
+            "négociations_instances_représentatives": ["CSE", "comité social et économique", "représentants du personnel", "délégués du personnel", "élections professionnelles"],
+            "négociation_collective": ["négociation collective", "accord d'entreprise", "convention collective", "accord collectif", "syndicat"]
+        },
+        "droit_civil": {
+            "rédaction_contrat_particulier": ["contrat entre particuliers", "reconnaissance de dette", "prêt entre particuliers", "contrat particulier"],
+            "litige_droit_consommation": ["droit de la consommation", "consommateur", "achat en ligne", "produit défectueux", "garantie légale de conformité", "démarchage"],
+            "litige_banque_particulier": ["banque", "crédit", "prêt bancaire", "surendettement", "fraude bancaire", "découvert"],
+            "litige_assurance_particulier": ["assurance", "assureur", "refus d'indemnisation", "sinistre", "indemnisation assurance"],
+            "consultation_juridique_particulier": ["consultation juridique", "conseil juridique particulier", "avis juridique"],
+            "défense_justice_particulier": ["assignation", "assigné", "tribunal judiciaire", "procès", "défense en justice", "mise en demeure"]
+        },
+        "droit_de_la_famille": {
+            "divorce_amiable": ["divorce amiable", "divorce à l'amiable", "divorce par consentement mutuel", "consentement mutuel"],
+            "divorce_contentieux": ["divorce contentieux", "divorce pour faute", "divorce conflictuel", "séparation conflictuelle"],
+            "garde_enfants": ["garde des enfants", "garde d'enfants", "garde alternée", "résidence des enfants", "droit de visite", "autorité parentale"],
+            "pension_alimentaire": ["pension alimentaire", "contribution à l'entretien", "prestation compensatoire"],
+            "succession": ["succession", "héritage", "héritier", "testament", "notaire succession", "réserve héréditaire", "donation"],
+            "adoption": ["adoption", "adopter", "adoption plénière", "adoption simple"]
+        },
+        "droit_pénal": {
+            "défense_pénale": ["défense pénale", "garde à vue", "plainte contre moi", "convocation police", "tribunal correctionnel", "casier judiciaire", "délit"],
+            "constitution_partie_civile": ["partie civile", "constitution de partie civile", "porter plainte", "victime", "dépôt de plainte"],
+            "comparution_immédiate": ["comparution immédiate", "comparution"],
+            "instruction_criminelle": ["instruction", "juge d'instruction", "mise en examen", "cour d'assises", "crime"]
+        },
+        "droit_public": {
+            "contentieux_administratif": ["tribunal administratif", "contentieux administratif", "recours administratif", "administration", "fonctionnaire", "recours pour excès de pouvoir"],
+            "marchés_publics": ["marché public", "marchés publics", "appel d'offres", "commande publique"],
+            "urbanisme": ["permis de construire", "urbanisme", "PLU", "déclaration préalable", "permis de démolir"],
+            "droit_des_collectivités": ["collectivité", "collectivités territoriales", "mairie", "commune", "conseil municipal"],
+            "droit_de_l'environnement": ["environnement", "pollution", "ICPE", "installation classée", "nuisances"]
+        }
+    }
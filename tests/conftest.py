@@ -0,0 +1,63 @@
+import os
+from types import SimpleNamespace
+
+# Avant tout import d'estimator : pas de clé réelle ni de cache persistant pendant les tests
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("RESPONSE_CACHE_PATH", "")
+
+import httpx
+
+from bench import FakeOpenAI
+
+REQUEST = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+
+
+def erreur_statut(classe, status: int):
+    return classe("erreur", response=httpx.Response(status, request=REQUEST), body=None)
+
+
+def sequence(*elements, defaut: str = "ok"):
+    """Réponses successives ; une exception de la liste est levée, puis defaut une fois la liste épuisée."""
+    restants = list(elements)
+
+    def repondre(**kwargs):
+        element = restants.pop(0) if restants else defaut
+        if isinstance(element, BaseException):
+            raise element
+        return element
+    return repondre
+
+
+class ScriptedCompletions:
+    """Réponses programmées avec l'interface de client.chat.completions.
+
+    repondre(**kwargs) renvoie le texte de la réponse ou lève une exception ; une
+    chaîne est renvoyée à chaque appel. Les arguments de chaque appel sont conservés
+    dans appels. Le rejeu de réponses enregistrées reste le rôle de bench.FakeCompletions.
+    """
+
+    def __init__(self, repondre):
+        self.repondre = repondre if callable(repondre) else (lambda **kwargs: repondre)
+        self.appels = []
+
+    def create(self, **kwargs):
+        self.appels.append(kwargs)
+        contenu = self.repondre(**kwargs)
+        usage = SimpleNamespace(prompt_tokens=10, completion_tokens=5, prompt_tokens_details=None)
+        if kwargs.get("stream"):
+            fragments = [
+                SimpleNamespace(usage=None, choices=[SimpleNamespace(delta=SimpleNamespace(content=contenu[i:i + 7]))])
+                for i in range(0, len(contenu), 7)
+            ]
+            return iter(fragments + [SimpleNamespace(model=kwargs.get("model"), usage=usage, choices=[])])
+        message = SimpleNamespace(content=contenu, tool_calls=None)
+        return SimpleNamespace(model=kwargs.get("model"), usage=usage, choices=[SimpleNamespace(message=message, logprobs=None)])
+
+
+class AsyncScriptedCompletions(ScriptedCompletions):
+    async def create(self, **kwargs):
+        return super().create(**kwargs)
+
+
+def fake_client(repondre, asynchrone: bool = False) -> FakeOpenAI:
+    return FakeOpenAI((AsyncScriptedCompletions if asynchrone else ScriptedCompletions)(repondre))
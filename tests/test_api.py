@@ -0,0 +1,14 @@
+from fastapi.testclient import TestClient
+
+import api
+import estimator
+
+
+def test_cabinet_inconnu_sans_store():
+    with TestClient(api.app) as client:
+        assert client.get("/catalogue").status_code == 200
+        assert client.get(f"/catalogue?office={estimator.CATALOGUE_OFFICE}").status_code == 200
+        for office in ("a", "b", "c"):
+            assert client.get(f"/catalogue?office={office}").status_code == 404
+            assert client.post("/quote", json={"domaine": "droit_du_travail", "prestation": "licenciement", "office": office}).status_code == 404
+    assert set(estimator._catalogues) == {estimator.CATALOGUE_OFFICE}
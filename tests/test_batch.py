@@ -0,0 +1,37 @@
+import asyncio
+import json
+
+import openai
+import pytest
+
+import batch
+import estimator
+from conftest import REQUEST, fake_client
+
+
+@pytest.fixture
+def fichiers(tmp_path):
+    entree = tmp_path / "questions.jsonl"
+    entree.write_text(json.dumps({"id": "q1", "question": "Mon employeur veut me licencier", "urgency": "Urgent"}) + "\n", encoding="utf-8")
+    return str(entree), str(tmp_path / "resultats.jsonl"), str(tmp_path / "reprise")
+
+
+def repondre(analyse_disponible):
+    def repondre(messages, **kwargs):
+        if "séparés par une virgule" in messages[-1]["content"]:
+            return "droit_du_travail, licenciement"
+        if not analyse_disponible:
+            raise openai.APIConnectionError(request=REQUEST)
+        return "1. Analyse. 2. Domaine : droit du travail 3. Code du travail"
+    return repondre
+
+
+def test_ligne_en_echec_retentee_a_la_reprise(fichiers, monkeypatch):
+    monkeypatch.setattr(estimator, "ESTIMATION_MODE", "two_calls")
+    monkeypatch.setattr(estimator, "_async_client", fake_client(repondre(False), asynchrone=True))
+    assert asyncio.run(batch.run_batch(*fichiers, concurrency=1)) == {"traites": 0, "ignores": 0, "erreurs": 1}
+    assert batch.load_checkpoint(fichiers[2]) == set()
+
+    monkeypatch.setattr(estimator, "_async_client", fake_client(repondre(True), asynchrone=True))
+    assert asyncio.run(batch.run_batch(*fichiers, concurrency=1)) == {"traites": 1, "ignores": 0, "erreurs": 0}
+    assert batch.load_checkpoint(fichiers[2]) == {"q1"}
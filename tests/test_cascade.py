@@ -0,0 +1,58 @@
+import asyncio
+import os
+import subprocess
+import sys
+
+import openai
+import pytest
+
+import estimator
+from conftest import erreur_statut, fake_client
+
+QUESTION = "Question sans libellé du catalogue"
+
+
+def cascade_client(indisponibles, asynchrone=False):
+    """Modèles indisponibles en erreur 404, réponse du catalogue pour les autres."""
+    def repondre(model, **kwargs):
+        if model in indisponibles:
+            raise erreur_statut(openai.NotFoundError, 404)
+        return "droit_du_travail, licenciement"
+    return fake_client(repondre, asynchrone)
+
+
+def modeles(client):
+    return [appel["model"] for appel in client.chat.completions.appels]
+
+
+@pytest.fixture
+def cascade(monkeypatch):
+    monkeypatch.setattr(estimator, "CLASSIFICATION_MODELS", ["inconnu", "gpt-4o"])
+    monkeypatch.setattr(estimator, "classify_locally", lambda question: None)
+
+
+def test_palier_en_erreur_passe_au_suivant(cascade, monkeypatch):
+    client = cascade_client({"inconnu"})
+    monkeypatch.setattr(estimator, "client", client)
+    assert estimator.analyze_question(QUESTION, "Particulier", "Normal") == ("droit_du_travail", "licenciement")
+    assert modeles(client) == ["inconnu", "gpt-4o"]
+
+
+def test_palier_en_erreur_passe_au_suivant_async(cascade, monkeypatch):
+    client = cascade_client({"inconnu"}, asynchrone=True)
+    monkeypatch.setattr(estimator, "_async_client", client)
+    assert asyncio.run(estimator.async_analyze_question(QUESTION, "Particulier", "Normal")) == ("droit_du_travail", "licenciement")
+    assert modeles(client) == ["inconnu", "gpt-4o"]
+
+
+def test_dernier_palier_en_erreur(cascade, monkeypatch):
+    monkeypatch.setattr(estimator, "client", cascade_client({"inconnu", "gpt-4o"}))
+    with pytest.raises(openai.NotFoundError):
+        estimator._remote_classification("cle", QUESTION, "Particulier", "Normal")
+
+
+def test_liste_de_modeles_vide():
+    env = {**os.environ, "CLASSIFICATION_MODELS": " , ", "LOG_LEVEL": "ERROR"}
+    sortie = subprocess.run([sys.executable, "-c", "import estimator; print(estimator.CLASSIFICATION_MODELS == [estimator.MODEL_NAME])"],
+                            cwd=os.path.dirname(estimator.__file__), env=env, capture_output=True, text=True, check=True)
+    assert sortie.stdout.strip().splitlines()[-1] == "True"
@@ -0,0 +1,36 @@
+import pytest
+
+from catalogue_index import CatalogueIndex, tokenize
+
+PRESTATIONS = {
+    "droit_public": {"urbanisme": 20, "contentieux_administratif": 15},
+    "droit_du_travail": {"licenciement": 10, "rédaction_contrat_travail": 5},
+    "droit_de_la_famille": {"garde_enfants": 12},
+}
+SYNONYMES = {
+    "droit_public": {"urbanisme": ["permis de construire", "PLU"]},
+    "droit_du_travail": {"rédaction_contrat_travail": ["contrat de travail", "CDD", "CDI"]},
+}
+
+
+@pytest.fixture(scope="module")
+def index() -> CatalogueIndex:
+    return CatalogueIndex(PRESTATIONS, SYNONYMES)
+
+
+@pytest.mark.parametrize("question", [
+    "Mon patron ne me paie plus",
+    "Mon fils ne me parle plus",
+    "Je n'ai plus de nouvelles de mon avocat",
+    "Il ne m'a jamais rien dit",
+])
+def test_negations_sans_classification(index, question):
+    assert "plu" not in tokenize(question)
+    domaine, prestation, confiance = index.classify(question)
+    assert (domaine, prestation) != ("droit_public", "urbanisme")
+    assert confiance < 0.8
+
+
+def test_sigle_en_majuscules(index):
+    assert index.classify("Le PLU de ma commune bloque mon projet")[:2] == ("droit_public", "urbanisme")
+    assert index.classify("Mon CDD n'a pas été renouvelé")[:2] == ("droit_du_travail", "rédaction_contrat_travail")
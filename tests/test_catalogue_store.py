@@ -0,0 +1,29 @@
+from catalogue_store import CatalogueSnapshot, CatalogueStore, compile_catalogue
+
+TARIFS = {"tarif_horaire_standard": 250, "facteur_urgence": 1.5, "forfaits": {"p": 1000}}
+
+
+def test_heures_decimales_entieres(tmp_path):
+    version = compile_catalogue({"d": {"p": 8.0, "q": 2.5}}, TARIFS, str(tmp_path))
+    snapshot = CatalogueSnapshot(str(tmp_path / f"{version}.sqlite3"))
+    assert snapshot.version == version
+    assert snapshot.prestations == {"d": {"p": 8, "q": 2.5}}
+    assert snapshot.tarifs == TARIFS
+
+
+def test_meme_version_quel_que_soit_le_type(tmp_path):
+    assert compile_catalogue({"d": {"p": 8.0}}, TARIFS, str(tmp_path)) == compile_catalogue({"d": {"p": 8}}, TARIFS, str(tmp_path))
+
+
+def test_cabinet_publie(tmp_path):
+    store = CatalogueStore(str(tmp_path))
+    version = compile_catalogue({"d": {"p": 8}}, TARIFS, str(tmp_path))
+    store.publish("paris", version)
+    assert store.snapshot("paris").version == version
+    assert "lyon" not in store.offices()
+
+
+def test_section_vide(tmp_path):
+    tarifs = {"tarif_horaire_standard": 250, "forfaits": {}, "frais_additionnels": {}}
+    version = compile_catalogue({"d": {"p": 8}}, tarifs, str(tmp_path))
+    assert CatalogueSnapshot(str(tmp_path / f"{version}.sqlite3")).tarifs == tarifs
@@ -0,0 +1,30 @@
+import pytest
+
+import estimator
+from conftest import fake_client
+
+ARGUMENTS = ("Mon employeur veut me licencier", "Particulier", "Normal", "droit_du_travail", "licenciement")
+REPONSES = {
+    "une_ligne": "1. Analyse du licenciement. 2. Domaine : droit du travail 3. Code du travail",
+    "titres_en_gras": (
+        "**1. Analyse détaillée :** Le licenciement doit être motivé.\n\n"
+        "**2. Éléments spécifiques utilisés :** {\"domaine\": \"droit du travail\"}\n\n"
+        "**3. Sources d'information :** Code du travail\n"
+    ),
+}
+
+
+@pytest.mark.parametrize("contenu", REPONSES.values(), ids=REPONSES.keys())
+def test_streaming_et_appel_unique_identiques(contenu, monkeypatch):
+    monkeypatch.setattr(estimator, "client", fake_client(contenu))
+    flux = estimator.DetailedAnalysisStream(*ARGUMENTS)
+    list(flux)
+    attendu = estimator.get_detailed_analysis(*ARGUMENTS)
+    assert (flux.analysis, flux.elements_used, flux.sources) == attendu
+    assert attendu[1] != {} and attendu[2] == "Code du travail"
+
+
+def test_titres_retires():
+    analysis, elements_used, _ = estimator._parse_detailed_response(REPONSES["titres_en_gras"])
+    assert analysis == "Le licenciement doit être motivé."
+    assert elements_used == {"domaine": "droit du travail"}
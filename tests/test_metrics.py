@@ -0,0 +1,7 @@
+from metrics import Metrics
+
+
+def test_etiquettes_echappees():
+    mesures = Metrics()
+    mesures.increment("http_requests", path='/x"}\\\n')
+    assert 'path="/x\\"}\\\\\\n"' in mesures.render_prometheus()
@@ -0,0 +1,41 @@
+import importlib.util
+from pathlib import Path
+
+import pytest
+
+from pricing import PricingTable
+
+RACINE = Path(__file__).resolve().parent.parent
+
+
+def charger(nom: str, fonction: str):
+    spec = importlib.util.spec_from_file_location(nom.replace("-", "_"), RACINE / f"{nom}.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return getattr(module, fonction)()
+
+
+@pytest.fixture(scope="module")
+def table() -> PricingTable:
+    return PricingTable(charger("prestations-heures", "get_prestations"), charger("tarifs-prestations", "get_tarifs"))
+
+
+def test_reprice_sans_proposition_egale_quote(table):
+    resultat = table.reprice()
+    for i, (domaine, prestation, urgency) in enumerate(zip(resultat["domaine"], resultat["prestation"], resultat["urgency"])):
+        basse, haute, _, _ = table.quote(domaine, prestation, urgency)
+        assert (resultat["estimation_basse"][i], resultat["estimation_haute"][i]) == (basse, haute), (domaine, prestation, urgency)
+
+
+def test_reprice_conserve_les_autres_forfaits(table):
+    initial = table.reprice()
+    resultat = table.reprice({"forfaits": {"rédaction_bail_commercial": 2000}})
+    modifiees = resultat["prestation"] == "rédaction_bail_commercial"
+    assert modifiees.sum() == 2
+    # Urgent : forfait de 2000 € au lieu de 2500 €, toujours plus avantageux que 3750 €
+    urgente = modifiees & (resultat["urgency"] == "Urgent")
+    assert initial["estimation"][urgente].tolist() == [2500]
+    assert resultat["estimation"][urgente].tolist() == [2000]
+    assert (resultat["estimation"][modifiees] != initial["estimation"][modifiees]).all()
+    assert (resultat["estimation"][~modifiees] == initial["estimation"][~modifiees]).all()
+    assert table.tarifs["forfaits"]["rédaction_bail_commercial"] == 2500
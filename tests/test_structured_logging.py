@@ -0,0 +1,20 @@
+import logging
+
+from metrics import metrics
+from structured_logging import LevelSampler, TimedQueueHandler
+
+
+def test_compteurs_par_enregistrement_sans_evenement_jsonl(monkeypatch):
+    evenements = []
+    monkeypatch.setattr(metrics, "_emit", evenements.append)
+    record = logging.LogRecord("test", logging.DEBUG, __file__, 1, "message %s", ("x",), None)
+
+    assert LevelSampler({"DEBUG": 0.0}).filter(record) is False
+    TimedQueueHandler(_FileFactice()).handle(record)
+    assert evenements == []
+    assert metrics.counters()['log_records_sampled_out{level="DEBUG"}'] >= 1
+
+
+class _FileFactice:
+    def put_nowait(self, record):
+        pass
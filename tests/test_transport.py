@@ -0,0 +1,222 @@
+import threading
+import time
+
+import httpx
+import openai
+import pytest
+
+from conftest import REQUEST, erreur_statut, fake_client, sequence
+from transport import (
+    LANE_STANDARD,
+    LANE_URGENT,
+    AdmissionRejected,
+    CircuitBreaker,
+    CircuitOpenError,
+    RateLimitScheduler,
+    ResilientTransport,
+    SingleFlight,
+    TransportError,
+)
+
+
+def client_erreurs(erreurs=()):
+    return fake_client(sequence(*erreurs))
+
+
+def contenu(reponse) -> str:
+    return reponse.choices[0].message.content
+
+
+def transport_ouvert() -> ResilientTransport:
+    """Disjoncteur ouvert par un délai dépassé, immédiatement à demi ouvert."""
+    transport = ResilientTransport(max_retries=0, breaker=CircuitBreaker(failure_threshold=1, recovery_time=0.0))
+    with pytest.raises(TransportError):
+        transport.create(client_erreurs([openai.APITimeoutError(request=REQUEST)]), "classification")
+    return transport
+
+
+def test_essai_libere_apres_erreur_non_reprise():
+    transport = transport_ouvert()
+    with pytest.raises(openai.BadRequestError):
+        transport.create(client_erreurs([erreur_statut(openai.BadRequestError, 400)]), "classification")
+    # L'échec de l'essai a rouvert le disjoncteur ; un nouvel essai referme le circuit
+    assert contenu(transport.create(client_erreurs(), "classification")) == "ok"
+    assert transport.breaker.state == "closed"
+
+
+def test_essai_libere_apres_delai_depasse():
+    transport = transport_ouvert()
+    transport.default_deadline = 0.0
+    with pytest.raises(TransportError):
+        transport.create(client_erreurs(), "classification")
+    transport.default_deadline = 30.0
+    assert contenu(transport.create(client_erreurs(), "classification")) == "ok"
+
+
+def test_essai_libere_apres_exception_quelconque():
+    transport = transport_ouvert()
+    with pytest.raises(ValueError):
+        transport.create(client_erreurs([ValueError("inattendu")]), "classification")
+    assert contenu(transport.create(client_erreurs(), "classification")) == "ok"
+
+
+def test_un_seul_essai_a_la_fois():
+    breaker = CircuitBreaker(failure_threshold=1, recovery_time=0.0)
+    breaker.record_failure()
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.release()
+    assert breaker.allow()
+
+
+def test_disjoncteur_ouvert_rejette_sans_appel():
+    transport = ResilientTransport(max_retries=0, breaker=CircuitBreaker(failure_threshold=1, recovery_time=60.0))
+    with pytest.raises(TransportError):
+        transport.create(client_erreurs([openai.APITimeoutError(request=REQUEST)]), "classification")
+    client = client_erreurs()
+    with pytest.raises(CircuitOpenError):
+        transport.create(client, "classification")
+    assert client.chat.completions.appels == []
+
+
+def test_quota_depasse_ne_compte_pas_comme_echec():
+    transport = ResilientTransport(max_retries=0, breaker=CircuitBreaker(failure_threshold=1, recovery_time=60.0))
+    for _ in range(3):
+        with pytest.raises(TransportError):
+            transport.create(client_erreurs([erreur_statut(openai.RateLimitError, 429)]), "classification")
+    assert transport.breaker.state == "closed"
+    assert contenu(transport.create(client_erreurs(), "classification")) == "ok"
+
+
+def test_premiere_requete_sur_le_thread_appelant():
+    threads = []
+
+    def repondre(**kwargs):
+        threads.append(threading.current_thread())
+        return "ok"
+
+    transport = ResilientTransport(hedge_delay=0.05)
+    client = fake_client(repondre)
+    assert contenu(transport.create(client, "classification", hedge=True)) == "ok"
+    time.sleep(0.1)
+    # Réponse avant hedge_delay : aucune requête doublée
+    assert threads == [threading.current_thread()]
+
+
+def test_requete_doublee_prend_le_relais():
+    def repondre(**kwargs):
+        if threading.current_thread() is threading.main_thread():
+            time.sleep(0.1)
+            raise openai.APITimeoutError(request=REQUEST)
+        return "doublon"
+
+    transport = ResilientTransport(max_retries=0, hedge_delay=0.02)
+    client = fake_client(repondre)
+    assert contenu(transport.create(client, "classification", hedge=True)) == "doublon"
+    assert len(client.chat.completions.appels) == 2
+
+
+def test_file_urgente_servie_en_premier():
+    scheduler = RateLimitScheduler(requests_per_minute=600)
+    scheduler._requests.level = 0
+    ordre = []
+
+    def demander(lane):
+        scheduler.acquire(100, lane, timeout=5)
+        ordre.append(lane)
+
+    standard = threading.Thread(target=demander, args=(LANE_STANDARD,))
+    standard.start()
+    while scheduler.depth()["standard"] == 0:
+        time.sleep(0.001)
+    urgent = threading.Thread(target=demander, args=(LANE_URGENT,))
+    urgent.start()
+    standard.join()
+    urgent.join()
+    assert ordre == [LANE_URGENT, LANE_STANDARD]
+    assert scheduler.depth() == {"urgent": 0, "societe": 0, "standard": 0}
+
+
+def test_admission_refusee_des_l_arrivee():
+    scheduler = RateLimitScheduler(requests_per_minute=60)
+    scheduler._requests.level = 0
+    debut = time.monotonic()
+    with pytest.raises(AdmissionRejected) as refus:
+        scheduler.acquire(100, LANE_STANDARD, timeout=0.1)
+    assert time.monotonic() - debut < 0.05
+    assert refus.value.position == 1
+    assert refus.value.estimated_wait > 0.1
+
+
+def test_pause_apres_quota_depasse():
+    scheduler = RateLimitScheduler()
+    transport = ResilientTransport(max_retries=0, scheduler=scheduler)
+    erreur = openai.RateLimitError("quota", response=httpx.Response(429, request=REQUEST, headers={"retry-after-ms": "200"}), body=None)
+    with pytest.raises(TransportError):
+        transport.create(client_erreurs([erreur]), "classification")
+    with pytest.raises(AdmissionRejected):
+        scheduler.acquire(100, LANE_URGENT, timeout=0.05)
+    debut = time.monotonic()
+    scheduler.acquire(100, LANE_URGENT, timeout=1)
+    assert time.monotonic() - debut >= 0.1
+
+
+def test_requete_doublee_sans_attente():
+    scheduler = RateLimitScheduler(requests_per_minute=60)
+    scheduler._requests.level = 1
+    assert scheduler.try_acquire(100)
+    # Quota épuisé : pas de requête doublée plutôt qu'une attente
+    assert not scheduler.try_acquire(100)
+
+
+def _appels_groupes(fonction, attendants: int = 3):
+    """Un meneur exécute fonction ; les autres appels de même clé arrivent pendant son exécution."""
+    groupe = SingleFlight()
+    liberer = threading.Event()
+    executions = []
+    resultats = {}
+
+    def meneur():
+        executions.append(1)
+        liberer.wait(5)
+        return fonction()
+
+    def appeler(nom):
+        try:
+            resultats[nom] = groupe.do("cle", "classification", meneur)
+        except Exception as e:
+            resultats[nom] = e
+
+    threads = [threading.Thread(target=appeler, args=(i,)) for i in range(attendants + 1)]
+    threads[0].start()
+    while groupe.in_flight() == 0:
+        time.sleep(0.001)
+    for thread in threads[1:]:
+        thread.start()
+    time.sleep(0.05)
+    liberer.set()
+    for thread in threads:
+        thread.join()
+    return executions, resultats, groupe
+
+
+def test_appels_identiques_regroupes_avec_copies():
+    executions, resultats, groupe = _appels_groupes(lambda: {"domaine": "droit_du_travail", "details": ["a"]})
+    assert len(executions) == 1
+    assert groupe.in_flight() == 0
+    valeurs = list(resultats.values())
+    assert all(v == valeurs[0] for v in valeurs)
+    # Chaque appelant reçoit son propre objet : une modification ne se propage pas
+    assert len({id(v) for v in valeurs}) == len(valeurs)
+    valeurs[0]["details"].append("modifié")
+    assert all(v["details"] == ["a"] for v in valeurs[1:])
+
+
+def test_erreur_transmise_aux_attendants():
+    def echouer():
+        raise openai.APITimeoutError(request=REQUEST)
+
+    executions, resultats, groupe = _appels_groupes(echouer)
+    assert len(executions) == 1
+    assert groupe.in_flight() == 0
+    assert all(isinstance(v, openai.APITimeoutError) for v in resultats.values())
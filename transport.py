@@ -0,0 +1,445 @@
+import contextvars
+import copy
+import itertools
+import json
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+import httpx
+import openai
+from openai import DefaultHttpxClient
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Part du budget total d'une estimation accordée à chaque étape
+STAGE_BUDGETS = {
+    "classification": 0.3,
+    "detailed_analysis": 0.7,
+    "structured": 0.9,
+}
+
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError, openai.InternalServerError)
+
+# Files de priorité du planificateur, de la plus prioritaire à la moins prioritaire
+LANES = ("urgent", "societe", "standard")
+LANE_URGENT, LANE_SOCIETE, LANE_STANDARD = range(len(LANES))
+
+# Estimation du nombre de tokens d'une requête à partir de la taille du prompt
+CHARS_PER_TOKEN = 3.5
+DEFAULT_COMPLETION_TOKENS = 500
+
+
+class TransportError(Exception):
+    """Appel au modèle abandonné sans réponse exploitable."""
+
+
+class DeadlineExceeded(TransportError):
+    pass
+
+
+class CircuitOpenError(TransportError):
+    pass
+
+
+class AdmissionRejected(TransportError):
+    """Requête refusée par le planificateur : l'attente prévue dépasse le délai disponible."""
+
+    def __init__(self, message: str, position: int, estimated_wait: float):
+        super().__init__(message)
+        self.position = position
+        self.estimated_wait = estimated_wait
+
+
+def pooled_http_client(max_connections: int = 50, max_keepalive: int = 20, keepalive_expiry: float = 60.0, connect_timeout: float = 5.0) -> DefaultHttpxClient:
+    """Client HTTP partagé : connexions maintenues ouvertes entre les estimations."""
+    return DefaultHttpxClient(
+        limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive, keepalive_expiry=keepalive_expiry),
+        timeout=httpx.Timeout(30.0, connect=connect_timeout),
+    )
+
+
+class Deadline:
+    """Budget de temps d'une estimation, réparti entre les étapes selon STAGE_BUDGETS."""
+
+    def __init__(self, total: float):
+        self.total = total
+        self.expires_at = time.monotonic() + total
+
+    def remaining(self) -> float:
+        return self.expires_at - time.monotonic()
+
+    def budget(self, stage: str) -> float:
+        restant = self.remaining()
+        if restant <= 0:
+            raise DeadlineExceeded(f"Délai de l'estimation dépassé avant l'étape {stage}")
+        return min(restant, self.total * STAGE_BUDGETS.get(stage, 1.0))
+
+
+_current_deadline: contextvars.ContextVar = contextvars.ContextVar("deadline", default=None)
+
+
+@contextmanager
+def deadline(total: float):
+    """Fixe le budget de l'estimation en cours ; les étapes imbriquées le partagent."""
+    if _current_deadline.get() is not None:
+        yield _current_deadline.get()
+        return
+    echeance = Deadline(total)
+    jeton = _current_deadline.set(echeance)
+    try:
+        yield echeance
+    finally:
+        _current_deadline.reset(jeton)
+
+
+class CircuitBreaker:
+    """Ouvert après failure_threshold échecs consécutifs ; un appel d'essai est
+    autorisé après recovery_time secondes, et le referme s'il réussit."""
+
+    def __init__(self, failure_threshold: int = 5, recovery_time: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.recovery_time = recovery_time
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half_open" if time.monotonic() - self._opened_at >= self.recovery_time else "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at >= self.recovery_time and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def release(self) -> None:
+        """Libère l'appel d'essai sans compter ni succès ni échec."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    logger.warning("Disjoncteur ouvert après %d échecs consécutifs", self._failures)
+                    metrics.increment("circuit_breaker_opened")
+                self._opened_at = time.monotonic()
+
+
+def retry_after(erreur: Exception) -> Optional[float]:
+    """Délai demandé par l'API dans les en-têtes retry-after-ms / retry-after."""
+    reponse = getattr(erreur, "response", None)
+    en_tetes = getattr(reponse, "headers", None) or {}
+    try:
+        if en_tetes.get("retry-after-ms"):
+            return float(en_tetes["retry-after-ms"]) / 1000
+        if en_tetes.get("retry-after"):
+            return float(en_tetes["retry-after"])
+    except ValueError:
+        pass
+    return None
+
+
+def estimate_tokens(kwargs: Dict[str, Any]) -> int:
+    """Tokens décomptés du quota par une requête : prompt estimé et complétion maximale."""
+    caracteres = sum(len(m.get("content") or "") for m in kwargs.get("messages", []))
+    if kwargs.get("tools"):
+        caracteres += len(json.dumps(kwargs["tools"], ensure_ascii=False))
+    return int(caracteres / CHARS_PER_TOKEN) + (kwargs.get("max_tokens") or DEFAULT_COMPLETION_TOKENS)
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_for(self, amount: float) -> float:
+        return max(0.0, (amount - self.level) / self.rate)
+
+
+class _Ticket:
+    def __init__(self, lane: int, sequence: int, tokens: int):
+        self.key = (lane, sequence)
+        self.lane = lane
+        self.tokens = tokens
+
+
+class RateLimitScheduler:
+    """Répartit le quota de l'API (requêtes et tokens par minute) entre les appels du
+    processus, par ordre de priorité puis d'arrivée.
+
+    Une requête dont l'attente prévue dépasse le délai dont elle dispose est refusée
+    dès son arrivée (AdmissionRejected) plutôt que d'expirer dans la file.
+    """
+
+    def __init__(self, requests_per_minute: float = 0, tokens_per_minute: float = 0, max_queue: int = 200):
+        self._requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self._tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_queue = max_queue
+        self._cond = threading.Condition()
+        self._file: List[_Ticket] = []
+        self._sequence = itertools.count()
+        self._paused_until = 0.0
+
+    def _attente(self, tickets: List[_Ticket], now: float) -> float:
+        """Délai avant que le quota couvre ces tickets, servis dans l'ordre."""
+        attente = max(0.0, self._paused_until - now)
+        if self._requests is not None:
+            attente = max(attente, self._requests.wait_for(len(tickets)))
+        if self._tokens is not None:
+            attente = max(attente, self._tokens.wait_for(sum(min(t.tokens, self._tokens.capacity) for t in tickets)))
+        return attente
+
+    def _refill(self, now: float) -> None:
+        for bucket in (self._requests, self._tokens):
+            if bucket is not None:
+                bucket.refill(now)
+
+    def _consume(self, ticket: _Ticket) -> None:
+        if self._requests is not None:
+            self._requests.level -= 1
+        if self._tokens is not None:
+            self._tokens.level -= min(ticket.tokens, self._tokens.capacity)
+
+    def depth(self) -> Dict[str, int]:
+        with self._cond:
+            return {lane: sum(1 for t in self._file if t.lane == i) for i, lane in enumerate(LANES)}
+
+    def acquire(self, tokens: int, lane: int, timeout: float) -> int:
+        """Attend le tour de la requête ; renvoie sa position à l'arrivée dans la file."""
+        debut = time.monotonic()
+        with self._cond:
+            self._refill(debut)
+            ticket = _Ticket(lane, next(self._sequence), tokens)
+            devant = [t for t in self._file if t.key < ticket.key]
+            position = len(devant) + 1
+            attente = self._attente(devant + [ticket], debut)
+            if len(self._file) >= self.max_queue or attente > timeout:
+                metrics.increment("scheduler_rejected", lane=LANES[lane])
+                raise AdmissionRejected(f"File d'attente du modèle : position {position}, attente estimée {attente:.1f}s", position, attente)
+
+            self._file.append(ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    restant = timeout - (now - debut)
+                    if min(self._file, key=lambda t: t.key) is ticket:
+                        attente = self._attente([ticket], now)
+                        if attente <= 0:
+                            self._consume(ticket)
+                            break
+                        if attente > restant:
+                            metrics.increment("scheduler_rejected", lane=LANES[lane])
+                            raise AdmissionRejected(f"Quota de l'API épuisé, attente estimée {attente:.1f}s", 1, attente)
+                        self._cond.wait(attente)
+                    elif restant <= 0:
+                        metrics.increment("scheduler_rejected", lane=LANES[lane])
+                        raise AdmissionRejected("Délai dépassé dans la file d'attente du modèle", position, 0.0)
+                    else:
+                        self._cond.wait(restant)
+            finally:
+                self._file.remove(ticket)
+                self._cond.notify_all()
+        metrics.increment("scheduler_admitted", lane=LANES[lane])
+        metrics.observe(f"scheduler_wait_{LANES[lane]}", time.monotonic() - debut)
+        return position
+
+    def try_acquire(self, tokens: int) -> bool:
+        """Consomme le quota sans attendre si personne n'est en file (requêtes doublées)."""
+        with self._cond:
+            now = time.monotonic()
+            self._refill(now)
+            ticket = _Ticket(len(LANES), 0, tokens)
+            if self._file or self._attente([ticket], now) > 0:
+                return False
+            self._consume(ticket)
+            return True
+
+    def pause(self, seconds: float) -> None:
+        """Suspend les admissions après un refus de l'API (429)."""
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._cond.notify_all()
+
+
+class _Appel:
+    def __init__(self):
+        self.done = threading.Event()
+        self.resultat: Any = None
+        self.erreur: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Regroupe les calculs identiques simultanés : le premier appelant d'une clé
+    exécute la fonction, les suivants attendent son résultat (ou son exception)
+    dans la limite du délai de leur propre estimation."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._en_cours: Dict[str, _Appel] = {}
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._en_cours)
+
+    def do(self, key: str, stage: str, fonction):
+        with self._lock:
+            appel = self._en_cours.get(key)
+            meneur = appel is None
+            if meneur:
+                appel = self._en_cours[key] = _Appel()
+
+        if not meneur:
+            metrics.increment("singleflight_collapsed", stage=stage)
+            echeance = _current_deadline.get()
+            if not appel.done.wait(max(0.0, echeance.remaining()) if echeance else None):
+                raise DeadlineExceeded(f"Délai dépassé en attendant le calcul {stage} en cours")
+            if appel.erreur is not None:
+                raise appel.erreur
+            # Copie : chaque appelant peut modifier son résultat sans affecter les autres
+            return copy.deepcopy(appel.resultat)
+
+        metrics.increment("singleflight_leaders", stage=stage)
+        try:
+            appel.resultat = fonction()
+            return appel.resultat
+        except BaseException as e:
+            appel.erreur = e
+            raise
+        finally:
+            with self._lock:
+                del self._en_cours[key]
+            appel.done.set()
+
+
+class ResilientTransport:
+    """Appels au modèle avec délai par étape, reprises espacées aléatoirement,
+    requêtes doublées optionnelles et disjoncteur."""
+
+    def __init__(self, max_retries: int = 2, base_delay: float = 0.5, max_delay: float = 8.0,
+                 default_deadline: float = 30.0, hedge_delay: Optional[float] = None,
+                 breaker: Optional[CircuitBreaker] = None, scheduler: Optional[RateLimitScheduler] = None):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.default_deadline = default_deadline
+        self.hedge_delay = hedge_delay
+        self.breaker = breaker or CircuitBreaker()
+        self.scheduler = scheduler
+        self._executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="hedge")
+
+    def create(self, client, stage: str, hedge: bool = False, priority: int = LANE_STANDARD, **kwargs: Any):
+        echeance = _current_deadline.get() or Deadline(self.default_deadline)
+        derniere_erreur: Optional[Exception] = None
+        for tentative in range(self.max_retries + 1):
+            if not self.breaker.allow():
+                metrics.increment("transport_rejected", stage=stage)
+                raise CircuitOpenError("API indisponible : disjoncteur ouvert")
+            try:
+                if self.scheduler is not None:
+                    self.scheduler.acquire(estimate_tokens(kwargs), priority, echeance.budget(stage))
+                timeout = echeance.budget(stage)
+                if hedge and self.hedge_delay and not kwargs.get("stream"):
+                    reponse = self._hedged(client, stage, timeout, kwargs)
+                else:
+                    reponse = client.chat.completions.create(timeout=timeout, **kwargs)
+            except RETRYABLE_ERRORS as e:
+                if isinstance(e, openai.RateLimitError):
+                    # L'API répond : le quota est géré par retry-after et la pause du planificateur
+                    self.breaker.release()
+                else:
+                    self.breaker.record_failure()
+                metrics.increment("transport_errors", stage=stage, error=type(e).__name__)
+                derniere_erreur = e
+                attente = retry_after(e)
+                if attente is None:
+                    # Backoff exponentiel avec gigue complète
+                    attente = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** tentative))
+                if self.scheduler is not None and isinstance(e, openai.RateLimitError):
+                    # Quota dépassé côté API : toutes les requêtes du processus patientent
+                    self.scheduler.pause(attente)
+                if tentative == self.max_retries or attente >= echeance.remaining():
+                    break
+                logger.warning("%s : %s, nouvelle tentative dans %.2fs", stage, type(e).__name__, attente)
+                metrics.increment("transport_retries", stage=stage)
+                time.sleep(attente)
+                continue
+            except openai.APIError as e:
+                self.breaker.record_failure()
+                metrics.increment("transport_errors", stage=stage, error=type(e).__name__)
+                raise
+            except BaseException:
+                # Délai dépassé ou requête refusée avant l'appel : l'essai éventuel est libéré
+                self.breaker.release()
+                raise
+            self.breaker.record_success()
+            return reponse
+        raise TransportError(f"Échec de l'appel {stage} après {tentative + 1} tentative(s)") from derniere_erreur
+
+    def _hedged(self, client, stage: str, timeout: float, kwargs: Dict[str, Any]):
+        # La première requête part du thread appelant ; une requête identique est confiée
+        # au pool si elle n'a pas répondu après hedge_delay. Le thread appelant attend sa
+        # propre réponse : la requête doublée prend le relais si la première échoue
+        # (délai dépassé, erreur), sans nouvelle tentative complète.
+        etat = {"termine": False, "doublon": None}
+        verrou = threading.Lock()
+
+        def doubler():
+            with verrou:
+                if etat["termine"]:
+                    return
+                if self.scheduler is None or self.scheduler.try_acquire(estimate_tokens(kwargs)):
+                    metrics.increment("hedged_requests", stage=stage)
+                    etat["doublon"] = self._executor.submit(client.chat.completions.create, timeout=max(0.1, timeout - self.hedge_delay), **kwargs)
+
+        minuteur = threading.Timer(self.hedge_delay, doubler)
+        minuteur.daemon = True
+        minuteur.start()
+        try:
+            return client.chat.completions.create(timeout=timeout, **kwargs)
+        except Exception as erreur:
+            with verrou:
+                etat["termine"] = True
+                doublon = etat["doublon"]
+            if doublon is None:
+                raise
+            try:
+                reponse = doublon.result()
+            except Exception:
+                raise erreur
+            metrics.increment("hedge_wins", stage=stage)
+            return reponse
+        finally:
+            minuteur.cancel()
+            with verrou:
+                etat["termine"] = True